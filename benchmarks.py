@@ -0,0 +1,174 @@
+# >>> compatibility with Python 3
+from __future__ import print_function, unicode_literals, division
+import sys
+if sys.version_info < (3,):  # pragma: no cover
+    from builtins import range as range3  # requires package future in Python2 (unfortunate, but there's no better way)
+else:  # pragma: no cover
+    range3 = range
+# <<< compatibility with Python 3
+
+# Benchmarks of the hot paths of factoradic, across sizes, to see how they scale and to catch regressions.
+#
+#   python benchmarks.py                                  # all the benchmarks, table on stdout
+#   python benchmarks.py --output base.json               # ... and the results as JSON
+#   python benchmarks.py --baseline base.json             # compare with saved results (exit status 1 if slower)
+#   python benchmarks.py --benchmarks next_factoradic --sizes 10 1000
+#
+# Every case (benchmark, size) runs some warmup calls, then is timed call by call with perf_counter_ns until it has
+# --repeat samples or has used --max-time seconds (at least 3 samples). Results are percentiles in nanoseconds.
+
+import argparse
+import json
+import math
+import random
+import time
+
+from factoradic import Factoradic
+
+_perf_counter_ns = getattr(time, 'perf_counter_ns', None) or (lambda: int(time.time() * 1e9))  # Python 3.7+
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+
+
+def random_factoradic(n, rng):  # well formed, n digits, the leading one not 0
+    digits = [rng.randint(0, n - 1 - i) for i in range3(n)]
+    digits[0] = max(digits[0], 1) if n > 1 else 0
+    return digits
+
+
+# each benchmark: setup(size, rng) -> the call to time (no arguments)
+def _setup_number_to_factoradic(n, rng):
+    value = Factoradic.factoradic_to_number(random_factoradic(n, rng))
+    return lambda: Factoradic.number_to_factoradic(value)
+
+
+def _setup_factoradic_to_number(n, rng):
+    digits = random_factoradic(n, rng)
+    return lambda: Factoradic.factoradic_to_number(digits)
+
+
+def _setup_cascade(n, rng):
+    digits = random_factoradic(n, rng)
+    digits[-2] += n  # something to carry
+    return lambda: Factoradic.cascade_factoradic_digits(digits)
+
+
+def _setup_next_factoradic(n, rng):
+    digits = random_factoradic(n, rng)
+    return lambda: Factoradic.next_factoradic(digits)
+
+
+def _setup_permutation(n, rng):
+    digits = random_factoradic(n, rng)
+    elements = list(range3(n))
+    return lambda: Factoradic.generate_permutation_from_factoradic(digits, elements)
+
+
+BENCHMARKS = {
+    'number_to_factoradic': _setup_number_to_factoradic,
+    'factoradic_to_number': _setup_factoradic_to_number,
+    'cascade_factoradic_digits': _setup_cascade,
+    'next_factoradic': _setup_next_factoradic,
+    'generate_permutation_from_factoradic': _setup_permutation,
+}
+
+
+def percentile(sorted_samples, p):  # linear interpolation between the closest ranks
+    k = (len(sorted_samples) - 1) * p / 100
+    low = int(math.floor(k))
+    high = min(low + 1, len(sorted_samples) - 1)
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (k - low)
+
+
+def measure(fn, warmup=2, repeat=20, max_time=2.0):
+    for _ in range3(warmup):
+        fn()
+    samples = []
+    deadline = _perf_counter_ns() + int(max_time * 1e9)
+    while len(samples) < repeat and (len(samples) < 3 or _perf_counter_ns() < deadline):
+        start = _perf_counter_ns()
+        fn()
+        samples.append(_perf_counter_ns() - start)
+    samples.sort()
+    return {'samples': len(samples), 'min': samples[0], 'max': samples[-1], 'mean': sum(samples) / len(samples),
+            'p50': percentile(samples, 50), 'p90': percentile(samples, 90), 'p99': percentile(samples, 99)}
+
+
+def run(benchmarks, sizes, warmup=2, repeat=20, max_time=2.0, seed=0):
+    results = {}
+    for name in benchmarks:
+        results[name] = {}
+        for n in sizes:
+            fn = BENCHMARKS[name](n, random.Random(seed))
+            results[name][str(n)] = measure(fn, warmup, repeat, max_time)  # str: JSON keys
+    return results
+
+
+def scaling_exponent(results, name, n1, n2):  # k such that time ~ size ** k between the two sizes
+    t1, t2 = results[name][str(n1)]['p50'], results[name][str(n2)]['p50']
+    if t1 <= 0 or t2 <= 0:
+        return float('nan')
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def compare(results, baseline, tolerance):  # [(name, size, ratio)] of the cases slower than baseline * (1 + tolerance)
+    regressions = []
+    for name, by_size in results.items():
+        for size, stats in by_size.items():
+            if size in baseline.get(name, {}):
+                ratio = stats['p50'] / max(baseline[name][size]['p50'], 1)
+                if ratio > 1 + tolerance:
+                    regressions.append((name, int(size), ratio))
+    return sorted(regressions)
+
+
+def format_table(results, baseline=None):
+    lines = ['%-38s %8s %14s %14s %14s %8s %8s' % ('benchmark', 'size', 'p50 (us)', 'p90 (us)', 'p99 (us)',
+                                                    'exponent', 'vs base')]
+    for name in sorted(results):
+        sizes = sorted(int(size) for size in results[name])
+        for i, n in enumerate(sizes):
+            stats = results[name][str(n)]
+            exponent = '%8.2f' % scaling_exponent(results, name, sizes[i - 1], n) if i else '%8s' % '-'
+            versus = '%8s' % '-'
+            if baseline and str(n) in baseline.get(name, {}):
+                versus = '%7.2fx' % (stats['p50'] / max(baseline[name][str(n)]['p50'], 1))
+            lines.append('%-38s %8d %14.1f %14.1f %14.1f %s %s' % (name, n, stats['p50'] / 1e3, stats['p90'] / 1e3,
+                                                                   stats['p99'] / 1e3, exponent, versus))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the factoradic hot paths.')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES), help='number of digits')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20, help='samples per case, at most')
+    parser.add_argument('--max-time', type=float, default=2.0, help='seconds per case, at most (after 3 samples)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown allowed against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.benchmarks, sorted(args.sizes), args.warmup, args.repeat, args.max_time, args.seed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    print(format_table(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'seed': args.seed, 'results': results}, f, indent=1,
+                      sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, size, ratio in regressions:
+            print('REGRESSION %s size %d: %.2fx the baseline median' % (name, size, ratio))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,36 +14,739 @@ else:  # pragma: no cover
 # I use the names imap and range3 to make it explicit for Python2 programmers and avoid confusion
 # <<< compatibility with Python 3
 
-from math import factorial as fact
+from math import factorial as fact, lgamma, log
+from bisect import bisect_left
+from functools import reduce, wraps
+from collections import deque, OrderedDict
+from array import array
+import threading
+import operator
+import mmap
+import struct
+import time
+import random
+import hashlib
+import inspect
+
+try:  # optional, used by the batch conversions
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+try:
+    from math import comb as _math_comb  # Python 3.8+
+except ImportError:  # pragma: no cover
+    _math_comb = None
+
+
+# above this size (in bits of the number) number_to_factoradic switches to the divide and conquer conversion
+NUMBER_TO_FACTORADIC_DC_THRESHOLD_BITS = 1024
+# above this many digits factoradic_to_number switches to merging on a product tree
+FACTORADIC_TO_NUMBER_DC_THRESHOLD = 512
+# above this size (in bits) integer operands of + and * go through the (divide and conquer) conversions instead of
+# being carried through the digits one at a time
+ARITHMETIC_DC_THRESHOLD_BITS = 8192
+# above this many elements permutations are generated with a Fenwick tree instead of list.pop (measured crossover:
+# 55000 to 75000 elements, list.pop is a fast memmove) ...
+PERMUTATION_FENWICK_THRESHOLD = 100000
+# ... and ranked with one instead of bisect and del on a list (measured crossover: 25000 to 35000 elements)
+PERMUTATION_RANK_FENWICK_THRESHOLD = 50000
+# batches of factoradics up to this width are converted with NumPy uint64 arithmetic (20! - 1 < 2 ** 64 <= 21! - 1)
+NUMPY_MAX_WIDTH = 20
+# ranges of the product tree at or below this many digits are converted with plain divmod, digit by digit
+PRODUCT_TREE_LEAF_SIZE = 32
+# default memory cap for the cache of factorials and product trees, see set_factorial_cache_limit
+FACTORIAL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# version of the binary records written by Factoradic.to_bytes and write_factoradics
+BINARY_FORMAT_VERSION = 1
+# cycle decompositions kept for power_permutation_rank, see permutation_cycles_cache_info
+PERMUTATION_CYCLES_CACHE_SIZE = 32
+
+_LN2 = log(2)
 
 
 class FactoradicException(Exception):
     pass
 
 
+# >>> product tree helpers
+# A node covers the digits with places [low, high) and is a tuple (product, low, high, left_node, right_node), where
+# product == high! / low! (the product low+1 * low+2 * ... * high). Leaves have no children.
+def _range_product(low, high):  # low+1 * low+2 * ... * high, by binary splitting
+    if high - low <= 8:
+        res = 1
+        for k in range3(low + 1, high + 1):
+            res *= k
+        return res
+    mid = (low + high) // 2
+    return _range_product(low, mid) * _range_product(mid, high)
+
+
+def _product_tree(low, high):
+    if high - low <= PRODUCT_TREE_LEAF_SIZE:
+        return _range_product(low, high), low, high, None, None
+    mid = (low + high) // 2
+    left = _product_tree(low, mid)
+    right = _product_tree(mid, high)
+    return left[0] * right[0], low, high, left, right
+
+
+def _split_on_product_tree(value, node, digits):  # value < node product. Writes digits[low:high], LSB first
+    _, low, high, left, right = node
+    if left is None:
+        for place in range3(low, high):
+            value, digits[place] = divmod(value, place + 1)
+        return
+    upper, lower = divmod(value, left[0])
+    _split_on_product_tree(lower, left, digits)
+    _split_on_product_tree(upper, right, digits)
+
+
+def _merge_on_product_tree(digits, node):  # inverse of _split_on_product_tree, reads digits[low:high]
+    _, low, high, left, right = node
+    if left is None:
+        value = 0
+        for place in range3(high - 1, low - 1, -1):
+            value = value * (place + 1) + digits[place]
+        return value
+    return _merge_on_product_tree(digits, left) + left[0] * _merge_on_product_tree(digits, right)
+
+
+def _tree_size(n):  # sizes are rounded up (by less than 1/8) so that trees can be shared by similar sizes
+    shift = max(0, n.bit_length() - 4)
+    return -(-n >> shift) << shift
+
+
+def _product_tree_bytes(node):
+    if node[3] is None:
+        return (node[0].bit_length() + 7) // 8
+    return (node[0].bit_length() + 7) // 8 + _product_tree_bytes(node[3]) + _product_tree_bytes(node[4])
+# <<< product tree helpers
+
+
+# >>> factorial cache
+# Factorials and product trees shared by all conversions. Least recently used entries are evicted once the total size
+# goes over the cap; entries too large for the cap on their own are not kept at all.
+_factorial_cache = OrderedDict()  # key -> (value, size in bytes), least recently used first
+_factorial_cache_state = {'bytes': 0, 'max_bytes': FACTORIAL_CACHE_MAX_BYTES, 'hits': 0, 'misses': 0}
+_factorial_cache_lock = threading.Lock()
+
+
+def _factorial_cache_get(key):
+    with _factorial_cache_lock:
+        entry = _factorial_cache.pop(key, None)
+        if entry is None:
+            _factorial_cache_state['misses'] += 1
+            return None
+        _factorial_cache[key] = entry  # most recently used now
+        _factorial_cache_state['hits'] += 1
+        return entry[0]
+
+
+def _factorial_cache_put(key, value, size):
+    with _factorial_cache_lock:
+        if key in _factorial_cache:
+            _factorial_cache_state['bytes'] -= _factorial_cache.pop(key)[1]
+        if size > _factorial_cache_state['max_bytes']:
+            return
+        _factorial_cache[key] = (value, size)
+        _factorial_cache_state['bytes'] += size
+        _evict_factorial_cache()
+
+
+def _evict_factorial_cache():  # call with the lock held
+    while _factorial_cache_state['bytes'] > _factorial_cache_state['max_bytes']:
+        _, (_, size) = _factorial_cache.popitem(last=False)
+        _factorial_cache_state['bytes'] -= size
+
+
+def cached_factorial(n):  # n!, grown from the nearest cached smaller factorial when there is a close one
+    res = _factorial_cache_get(('factorial', n))
+    if res is None:
+        with _factorial_cache_lock:
+            below = [key[1] for key in _factorial_cache if key[0] == 'factorial' and key[1] < n]
+            nearest = max(below) if below else None
+            base = _factorial_cache[('factorial', nearest)][0] if below else None
+        if base is not None and n - nearest <= n // 8:
+            res = base * _range_product(nearest, n)
+        else:
+            res = fact(n)
+        _factorial_cache_put(('factorial', n), res, (res.bit_length() + 7) // 8)
+    return res
+
+
+def cached_product_tree(size):  # product tree over the places [0, size), its root is size!
+    tree = _factorial_cache_get(('tree', size))
+    if tree is None:
+        tree = _product_tree(0, size)
+        _factorial_cache_put(('tree', size), tree, _product_tree_bytes(tree))
+    return tree
+
+
+def factorial_cache_info():
+    with _factorial_cache_lock:
+        info = dict(_factorial_cache_state)
+        info['entries'] = len(_factorial_cache)
+        return info
+
+
+def clear_factorial_cache():
+    with _factorial_cache_lock:
+        _factorial_cache.clear()
+        _factorial_cache_state.update(bytes=0, hits=0, misses=0)
+
+
+def set_factorial_cache_limit(max_bytes):  # evicts right away if needed, 0 disables the cache
+    with _factorial_cache_lock:
+        _factorial_cache_state['max_bytes'] = max_bytes
+        _evict_factorial_cache()
+# <<< factorial cache
+
+# >>> permutation cycles cache
+# Cycle decompositions of the permutations raised to powers (power_permutation_rank), so that the powers of the same
+# generator - as in a sweep over its orbit - don't unrank it and find its cycles again every time.
+_cycles_cache = OrderedDict()  # (rank or its record, n) -> the cycles, least recently used first
+_cycles_cache_state = {'max_entries': PERMUTATION_CYCLES_CACHE_SIZE, 'hits': 0, 'misses': 0}
+_cycles_cache_lock = threading.Lock()
+
+
+def _cached_cycles(rank, n):
+    key = (rank.to_bytes() if isinstance(rank, Factoradic) else rank, n)  # to_bytes: no conversion to a number
+    with _cycles_cache_lock:
+        cycles = _cycles_cache.pop(key, None)
+        if cycles is not None:
+            _cycles_cache[key] = cycles  # most recently used now
+            _cycles_cache_state['hits'] += 1
+            return cycles
+        _cycles_cache_state['misses'] += 1
+    cycles = _cycles(_indices_of_rank(rank, n, 'power_permutation_rank'))
+    with _cycles_cache_lock:
+        _cycles_cache[key] = cycles
+        while len(_cycles_cache) > _cycles_cache_state['max_entries']:
+            _cycles_cache.popitem(last=False)
+    return cycles
+
+
+def permutation_cycles_cache_info():
+    with _cycles_cache_lock:
+        info = dict(_cycles_cache_state)
+        info['entries'] = len(_cycles_cache)
+        return info
+
+
+def clear_permutation_cycles_cache():
+    with _cycles_cache_lock:
+        _cycles_cache.clear()
+        _cycles_cache_state.update(hits=0, misses=0)
+# <<< permutation cycles cache
+
+
+# >>> Fenwick tree (binary indexed tree) helpers
+# The tree counts which positions of a list are still available, so that "the k-th remaining element" can be found and
+# removed in O(log n) instead of the O(n) of list.pop(k). Positions are 1-based inside the tree.
+def _fenwick_tree_all_ones(n):  # same as adding 1 at every position, in O(n)
+    return [0] + [i & -i for i in range3(1, n + 1)]
+
+
+def _select_with_fenwick_tree(factoradic_value, elements):  # like popping each digit from a copy of elements
+    n = len(elements)
+    tree = _fenwick_tree_all_ones(n)
+    top_step = 1 << (n.bit_length() - 1) if n else 0
+    remaining = n
+    res = []
+    append = res.append
+    for digit in factoradic_value:
+        if digit < 0:  # negative indices behave as they do with list.pop
+            digit += remaining
+        if not 0 <= digit < remaining:
+            raise IndexError('pop index out of range')
+        pos = 0  # walk down the tree to the (digit+1)-th available position
+        step = top_step
+        while step:
+            nxt = pos + step
+            if nxt <= n and tree[nxt] <= digit:
+                pos = nxt
+                digit -= tree[nxt]
+            step >>= 1
+        append(elements[pos])
+        pos += 1
+        while pos <= n:  # and remove it
+            tree[pos] -= 1
+            pos += pos & -pos
+        remaining -= 1
+    return res
+
+
+def _rank_with_fenwick_tree(indices):  # digit i counts the positions below indices[i] not used by indices[:i]
+    n = len(indices)
+    tree = _fenwick_tree_all_ones(n)
+    res = []
+    append = res.append
+    for index in indices:
+        digit = 0
+        pos = index  # prefix sum of the available positions before 'index'
+        while pos > 0:
+            digit += tree[pos]
+            pos -= pos & -pos
+        append(digit)
+        pos = index + 1
+        while pos <= n:  # and remove 'index'
+            tree[pos] -= 1
+            pos += pos & -pos
+    return res
+
+# A sparse tree (a dict) counts the positions already taken instead, for when only k of n positions are ever used:
+# the costs are then O(log n) per operation, with no O(n) set up.
+def _sparse_tree_add(tree, n, index, delta):  # index is 0-based
+    pos = index + 1
+    while pos <= n:
+        tree[pos] = tree.get(pos, 0) + delta
+        pos += pos & -pos
+
+
+def _sparse_tree_taken_below(tree, index):  # how many positions before 'index' are taken
+    res = 0
+    while index > 0:
+        res += tree.get(index, 0)
+        index -= index & -index
+    return res
+
+
+def _sparse_tree_select(tree, n, free):  # index of the (free+1)-th position not taken
+    pos = 0
+    step = 1 << (n.bit_length() - 1) if n else 0
+    while step:
+        nxt = pos + step
+        if nxt <= n and step - tree.get(nxt, 0) <= free:  # the node covers the 'step' positions after pos
+            pos = nxt
+            free -= step - tree.get(nxt, 0)
+        step >>= 1
+    return pos
+
+# Trees over counts (of repeated values, for multiset permutations): select by cumulative count in O(log d).
+def _fenwick_tree_from_counts(counts):  # O(d)
+    tree = [0] + list(counts)
+    for i in range3(1, len(tree)):
+        parent = i + (i & -i)
+        if parent < len(tree):
+            tree[parent] += tree[i]
+    return tree
+
+
+def _fenwick_tree_add(tree, index, delta):  # index is 0-based
+    pos = index + 1
+    while pos < len(tree):
+        tree[pos] += delta
+        pos += pos & -pos
+
+
+def _fenwick_tree_prefix(tree, index):  # sum of the counts before 'index'
+    res = 0
+    while index > 0:
+        res += tree[index]
+        index -= index & -index
+    return res
+
+
+def _fenwick_tree_select(tree, total):  # (index, counts before it): the first index where the sum goes above 'total'
+    pos = 0
+    before = 0
+    step = 1 << ((len(tree) - 1).bit_length() - 1) if len(tree) > 1 else 0
+    while step:
+        nxt = pos + step
+        if nxt < len(tree) and before + tree[nxt] <= total:
+            pos = nxt
+            before += tree[nxt]
+        step >>= 1
+    return pos, before
+# <<< Fenwick tree helpers
+
+
+# smallest array typecode able to hold the digits of a factoradic of a given length (a digit is always below the length)
+_DIGIT_TYPECODES = [(1 << 8, str('B')), (1 << 16, str('H'))]  # str() as array needs a byte string in Python2
+_DIGIT_TYPECODES.append((1 << 32, str('I') if array(str('I')).itemsize >= 4 else str('L')))
+
+
+def _compact_digits(digits):
+    for limit, typecode in _DIGIT_TYPECODES:
+        if len(digits) <= limit:
+            return array(typecode, digits)
+    return array(str('Q'), digits)  # pragma: no cover - over 4 billion digits
+
+
+# >>> binary format
+# A record is: a version byte (BINARY_FORMAT_VERSION), a byte with the width in bytes of every digit (1, 2 or 4,
+# chosen from the number of digits as in _compact_digits), the number of digits as a LEB128 varint and then the
+# digits, most significant first, as little endian unsigned integers. Records are self-delimiting, so files are just
+# records one after another.
+_WIDTH_TYPECODES = dict((array(typecode).itemsize, typecode) for _, typecode in reversed(_DIGIT_TYPECODES))
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def _varint(n):
+    res = bytearray()
+    while n > 0x7f:
+        res.append((n & 0x7f) | 0x80)
+        n >>= 7
+    res.append(n)
+    return res
+
+
+def _digits_to_record(digits):  # digits: a compact array
+    if not _LITTLE_ENDIAN:  # pragma: no cover
+        digits = array(digits.typecode, digits)
+        digits.byteswap()
+    res = bytearray((BINARY_FORMAT_VERSION, digits.itemsize))
+    res += _varint(len(digits))
+    res += digits.tobytes() if hasattr(digits, 'tobytes') else digits.tostring()
+    return bytes(res)
+
+
+def _parse_record_header(data, pos):  # (typecode, digit count, payload start), or None if 'data' ends before that
+    if pos + 2 > len(data):
+        return None
+    if data[pos] != BINARY_FORMAT_VERSION:
+        raise FactoradicException('unsupported factoradic record version: ' + str(data[pos]))
+    typecode = _WIDTH_TYPECODES.get(data[pos + 1])
+    if typecode is None:
+        raise FactoradicException('bad digit width in factoradic record: ' + str(data[pos + 1]))
+    count = shift = 0
+    pos += 2
+    while True:
+        if pos >= len(data):
+            return None
+        byte = data[pos]
+        count |= (byte & 0x7f) << shift
+        shift += 7
+        pos += 1
+        if byte < 0x80:
+            return typecode, count, pos
+
+
+def _record_digits(data, typecode, count, start):  # digits of a record as a new array
+    digits = array(typecode)
+    payload = bytes(data[start:start + count * digits.itemsize])
+    if hasattr(digits, 'frombytes'):
+        digits.frombytes(payload)
+    else:  # pragma: no cover
+        digits.fromstring(payload)
+    if not _LITTLE_ENDIAN:  # pragma: no cover
+        digits.byteswap()
+    return digits
+
+
+def _record_to_factoradic(data, typecode, count, start, validate):
+    digits = _record_digits(data, typecode, count, start)
+    if count == 0 or (validate and not Factoradic.is_well_formed_factoradic(digits)):
+        raise FactoradicException('factoradic record not well formed')
+    if digits[0] == 0 and count > 1:
+        return _factoradic_from_digits(digits.tolist())
+    res = Factoradic.__new__(Factoradic)
+    res._d = digits
+    return res
+# <<< binary format
+
+
+def _factoradic_range(start, stop):  # the factoradics for [start, stop), each as a list yielded once
+    digits = Factoradic.number_to_factoradic(start)
+    for _ in range3(start, stop):
+        yield digits
+        Factoradic.inc1_well_formed_inplace(digits)
+
+
+def _strip_leading_zeros(digits):  # a slice without the leading zeros (but the last digit), or 'digits' itself
+    first = 0
+    while first < len(digits) - 1 and digits[first] == 0:
+        first += 1
+    return digits[first:] if first else digits
+
+
+def _factoradic_from_digits(digits):  # Factoradic from trusted well formed digits, which may have leading zeros
+    return Factoradic.trusted(digits)
+
+
+def _add_from_place_one(digits, inc):  # adds inc to well formed digits in place, returns the carry out of the top
+    i = len(digits) - 2
+    place = 1
+    while inc and i >= 0:
+        inc += digits[i]
+        if inc <= place:
+            digits[i] = inc
+            return 0
+        digits[i] = inc % (place + 1)
+        inc //= place + 1
+        i -= 1
+        place += 1
+    return inc
+
+
+def _subtract_from_place_one(digits, dec):  # like _add_from_place_one, returns the borrow out of the top
+    i = len(digits) - 2
+    place = 1
+    while dec and i >= 0:
+        dec = digits[i] - dec
+        if dec >= 0:
+            digits[i] = dec
+            return 0
+        borrow = -dec // (place + 1) + (-dec % (place + 1) != 0)
+        digits[i] = dec + borrow * (place + 1)
+        dec = borrow
+        i -= 1
+        place += 1
+    return dec
+
+
+def _carry_digits(carry, length):  # the digits to put in front of 'length' digits for a carry out of them
+    res = []
+    place = length
+    while carry:
+        res.append(carry % (place + 1))
+        carry //= place + 1
+        place += 1
+    res.reverse()
+    return res
+
+
+def _as_factoradic(value):  # for the operators: Factoradic or list, NotImplemented otherwise
+    if isinstance(value, Factoradic):
+        return value
+    if isinstance(value, list):
+        return Factoradic(value)
+    return NotImplemented
+
+
+_NO_INITIAL = object()  # parallel_permutations default, so that callers can fold from None
+
+
+def _permutation_chunk(elements, start, end, map_fn, reduce_fn, initial, has_initial):  # parallel_permutations worker
+    values = Factoradic.iter_permutations(elements, start, end)
+    if map_fn is not None:
+        values = imap(map_fn, range3(start, end), values)
+    if reduce_fn is None:
+        return list(values)
+    if has_initial:
+        return reduce(reduce_fn, values, initial)
+    return reduce(reduce_fn, values)
+
+
+def _permutation_indices(permutation, elements):  # positions in 'elements' of each item of 'permutation'
+    if len(permutation) != len(elements):
+        raise FactoradicException('factoradic_from_permutation failed: permutation and elements differ in length')
+    positions = {}  # element -> its positions, reversed so that repeated elements take the first position first
+    try:
+        for i in range3(len(elements) - 1, -1, -1):
+            positions.setdefault(elements[i], []).append(i)
+    except TypeError:  # unhashable elements (lists...): found by equality instead, in O(n ** 2)
+        return _permutation_indices_by_equality(permutation, elements)
+    try:
+        return [positions[x].pop() for x in permutation]
+    except (KeyError, IndexError, TypeError):
+        raise FactoradicException('factoradic_from_permutation failed: not a permutation of elements')
+
+
+def _permutation_indices_by_equality(permutation, elements):  # same result as _permutation_indices, for any elements
+    used = [False] * len(elements)
+    res = []
+    for x in permutation:
+        for i in range3(len(elements)):
+            if not used[i] and elements[i] == x:
+                used[i] = True
+                res.append(i)
+                break
+        else:
+            raise FactoradicException('factoradic_from_permutation failed: not a permutation of elements')
+    return res
+
+
+def _lehmer_digits(indices):  # the factoradic of a permutation of range(n), padded to n digits
+    if len(indices) > PERMUTATION_RANK_FENWICK_THRESHOLD:
+        return _rank_with_fenwick_tree(indices)
+    available = list(range3(len(indices)))  # each digit counts the available positions before the chosen one
+    res = []
+    for index in indices:
+        digit = bisect_left(available, index)
+        del available[digit]
+        res.append(digit)
+    return res
+
+
+def _digits_of_rank(rank, n, name):  # the digits of 'rank' (a number or a Factoradic), checked to fit n elements
+    if isinstance(rank, Factoradic):
+        digits = rank.v  # no conversion if the object has its digits already
+    elif rank < 0:
+        raise FactoradicException(name + ' failed: negative rank')
+    else:
+        digits = Factoradic.number_to_factoradic(rank)
+    if len(digits) > max(n, 1):
+        raise FactoradicException(name + ' failed: rank out of range for ' + str(n) + ' elements')
+    return digits
+
+
+def _indices_of_rank(rank, n, name):  # the permutation of range(n) numbered 'rank' (a number or a Factoradic)
+    digits = _digits_of_rank(rank, n, name)
+    if n == 0:
+        return []
+    return Factoradic.generate_permutation_from_factoradic(Factoradic.padded_to_length_s(digits, n), list(range3(n)))
+
+
+def _rank_of_indices(indices, like):  # a Factoradic (with digits only) if 'like' is one, otherwise a number
+    if isinstance(like, Factoradic):
+        return Factoradic.trusted(_lehmer_digits(indices) or [0])
+    return Factoradic.factoradic_to_number(_lehmer_digits(indices))
+
+
+def _cycles(indices):  # the cycles of a permutation of range(n), fixed points included, as lists of positions
+    seen = [False] * len(indices)
+    res = []
+    for start in range3(len(indices)):
+        if not seen[start]:
+            cycle = []
+            i = start
+            while not seen[i]:
+                seen[i] = True
+                cycle.append(i)
+                i = indices[i]
+            res.append(cycle)
+    return res
+
+
+def _item_indices(items, elements, name):  # positions in 'elements' of each of 'items', all different
+    if isinstance(elements, range3):  # O(1) lookups, so ranking doesn't depend on len(elements)
+        try:
+            indices = [elements.index(x) for x in items]
+        except ValueError:
+            indices = None
+        if indices is None or len(set(indices)) != len(indices):
+            raise FactoradicException(name + ' failed: not made of different items of elements')
+        return indices
+    positions = {}  # as in _permutation_indices, repeated elements take their first position first
+    for i in range3(len(elements) - 1, -1, -1):
+        positions.setdefault(elements[i], []).append(i)
+    try:
+        return [positions[x].pop() for x in items]
+    except (KeyError, IndexError):
+        raise FactoradicException(name + ' failed: not made of different items of elements')
+
+
+def _binomial(n, k):  # n choose k, 0 outside 0 <= k <= n
+    if not 0 <= k <= n:
+        return 0
+    if _math_comb is not None:
+        return _math_comb(n, k)
+    k = min(k, n - k)
+    return _range_product(n - k, n) // cached_factorial(k)
+
+
+def _check_k(n, k, name):
+    if not 0 <= k <= n:
+        raise FactoradicException(name + ' failed: k must be between 0 and the number of elements')
+
+
+def _multiset(elements):  # (the different values in order of first occurrence, their counts, value -> its position)
+    positions = {}
+    values = []
+    counts = []
+    for x in elements:
+        i = positions.get(x)
+        if i is None:
+            i = positions[x] = len(values)
+            values.append(x)
+            counts.append(0)
+        counts[i] += 1
+    return values, counts, positions
+
+
+def _multinomial(counts):  # (c1 + c2 + ...)! / (c1! c2! ...), built up one item at a time
+    res = 1
+    total = 0
+    for count in counts:
+        for j in range3(1, count + 1):
+            total += 1
+            res = res * total // j  # exact: res is then C(total, j) times the earlier multinomial
+    return res
+
+
+def _next_permutation_inplace(indices):
+    # lexicographic successor, repeated values allowed: returns the first position changed, or -1 (and leaves the
+    # list unchanged) after the last permutation
+    i = len(indices) - 2
+    while i >= 0 and indices[i] >= indices[i + 1]:
+        i -= 1
+    if i < 0:
+        return -1
+    j = len(indices) - 1
+    while indices[j] <= indices[i]:
+        j -= 1
+    indices[i], indices[j] = indices[j], indices[i]
+    low, high = i + 1, len(indices) - 1
+    while low < high:  # reverses the suffix in place, without a temporary list
+        indices[low], indices[high] = indices[high], indices[low]
+        low += 1
+        high -= 1
+    return i
+
+
 class Factoradic(object):
+    # The value is kept as a number (_n), as digits (_digits, most significant first, in a compact array - see
+    # _compact_digits) or both: whichever is missing is converted on first use and kept. Objects built from numbers
+    # and only compared, hashed or turned back into numbers never convert to digits at all.
+    __slots__ = ('_n', '_digits')
+
     def __init__(self, value = None):  # constructs either from a number, a list, a string or a Factoradic object (copy)
+        self._n = self._digits = None
         if value is None:
-            self.v = [0]  # no value creates a [0] by default
+            self._n = 0  # no value creates a [0] by default
+            return
         elif isinstance(value, integer_types):
-            self.v = Factoradic.number_to_factoradic(value)
+            if value < 0:
+                raise FactoradicException('Factoradic __init__ failed: negative value (not supported)')
+            self._n = value
+            return
         elif isinstance(value, Factoradic):
-            self.v = value.v[:]  # copy
+            self._n = value._n  # copy - already normalised
+            self._digits = value._digits[:] if value._digits is not None else None
+            return
         elif isinstance(value, list):
-            if Factoradic.is_well_formed_factoradic(value):
-                self.v = value[:]  # copy -- if creation time is critical, use the static method interface instead ...
-                # ... and work with naked lists.
-            else:
-                raise FactoradicException('Factoradic __init__ failed: value not well formed')
+            digits = value  # copied by _compact_digits -- if creation time is critical, use trusted() or the ...
+            # ... static method interface instead and work with naked lists.
         elif isinstance(value, unicode):  # would be basestring in Python2 if not for the __future__ import
-            l = Factoradic.string_to_factoradic(value)
-            if Factoradic.is_well_formed_factoradic(l):
-                self.v = l
+            digits = Factoradic.string_to_factoradic(value)
         else:
             raise FactoradicException('Factoradic __init__ failed - could not deal with value ' + repr(value))
 
-        while self.v[0] == 0 and len(self.v) > 1:  # zero-padded value - normalise to remove padding.
-            self.v.pop(0)
+        if not digits or not Factoradic.is_well_formed_factoradic(digits):
+            raise FactoradicException('Factoradic __init__ failed: value not well formed')
+        self._digits = _compact_digits(_strip_leading_zeros(digits))
+
+    @staticmethod
+    def trusted(value):  # no checks: a number >= 0 (O(1)), or well formed digits that may have leading zeros
+        res = Factoradic.__new__(Factoradic)
+        if isinstance(value, integer_types):
+            res._n, res._digits = value, None
+        else:
+            res._n, res._digits = None, _compact_digits(_strip_leading_zeros(value))
+        return res
+
+    @property
+    def _d(self):  # the digits, converted from the number on first use
+        if self._digits is None:
+            self._digits = _compact_digits(Factoradic.number_to_factoradic(self._n))
+        return self._digits
+
+    @_d.setter
+    def _d(self, digits):  # the number is converted again from these digits when needed
+        self._n, self._digits = None, digits
+
+    @property
+    def v(self):  # the digits as a list (a copy: assign to v to change them)
+        return self._d.tolist()
+
+    @v.setter
+    def v(self, digits):  # checked and normalised: other methods rely on well formed digits with no leading zeros
+        digits = list(digits)
+        if not digits or min(digits) < 0 or not Factoradic.is_well_formed_factoradic(digits):
+            raise FactoradicException('Factoradic v failed: value not well formed')
+        self._d = _compact_digits(_strip_leading_zeros(digits))
 
     def __str__(self):
         # return "".join(imap(lambda x: str(x), self.v)) # would only work for small factoradics
@@ -54,47 +757,237 @@ class Factoradic(object):
     def __eq__(self, other):
         #return self.__dict__ == other.__dict__
         if isinstance(other, Factoradic):
-            return self.v == other.v  # explicitly compare the relevant state only
-        elif isinstance(other, list):
-            return self.v == other
+            if self._digits is None or other._digits is None:
+                return self.to_number() == other.to_number()
+            return self._digits == other._digits  # explicitly compare the relevant state only
+        elif isinstance(other, list):  # normalised as in _compare
+            try:
+                return self == Factoradic(other)
+            except FactoradicException:  # not a factoradic, so not equal to any
+                return False
         else:
-            raise FactoradicException('comparing Factoradic to unsupported type: ' + str(type(other)))
+            return NotImplemented  # not equal - so that Factoradics can share dicts and sets with other keys
+
+    def __ne__(self, other):  # Python2 doesn't derive it from __eq__
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def __hash__(self):  # by value, so the same whichever representation the object holds
+        return hash(self.to_number())
+
+    # ordering: by number if either side has no digits yet, otherwise for normalised digits the longer the larger,
+    # then the first different digit decides
+    def _compare(self, other):
+        if isinstance(other, list):
+            other = Factoradic(other)
+        elif not isinstance(other, Factoradic):
+            return NotImplemented
+        if self._digits is None or other._digits is None:
+            a, b = self.to_number(), other.to_number()
+            return -1 if a < b else int(a != b)
+        if len(self._digits) != len(other._digits):
+            return -1 if len(self._digits) < len(other._digits) else 1
+        return -1 if self._digits < other._digits else int(self._digits != other._digits)
+
+    def __lt__(self, other):
+        res = self._compare(other)
+        return res if res is NotImplemented else res < 0
+
+    def __le__(self, other):
+        res = self._compare(other)
+        return res if res is NotImplemented else res <= 0
+
+    def __gt__(self, other):
+        res = self._compare(other)
+        return res if res is NotImplemented else res > 0
+
+    def __ge__(self, other):
+        res = self._compare(other)
+        return res if res is NotImplemented else res >= 0
+
+    # arithmetic works on the numbers when both are known, otherwise on the digits, with carries as in
+    # cascade_factoradic_digits_inplace. Lists are taken as factoradics and integers as numbers: large ones (see
+    # ARITHMETIC_DC_THRESHOLD_BITS) are converted first, a big carry costs a big integer divmod per digit. Negative
+    # results are not supported: subtraction raises FactoradicException.
+    def __add__(self, other):
+        if isinstance(other, integer_types):
+            if other < 0:
+                return self - (-other)
+            if self._n is not None:
+                return Factoradic.trusted(self._n + other)
+            if other.bit_length() > ARITHMETIC_DC_THRESHOLD_BITS:
+                return _factoradic_from_digits(
+                    Factoradic.add_factoradics(self._digits, Factoradic.number_to_factoradic(other)))
+            res = Factoradic(self)
+            res.increment(other)
+            return res
+        other = _as_factoradic(other)
+        if other is NotImplemented:
+            return other
+        if self._n is not None and other._n is not None:
+            return Factoradic.trusted(self._n + other._n)
+        return _factoradic_from_digits(Factoradic.add_factoradics(self._d, other._d))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, integer_types) and other < 0:
+            return self + (-other)
+        other = Factoradic(other) if isinstance(other, integer_types) else _as_factoradic(other)
+        if other is NotImplemented:
+            return other
+        if self._n is not None and other._n is not None:
+            if other._n > self._n:
+                raise FactoradicException('Factoradic subtraction failed: negative result (not supported)')
+            return Factoradic.trusted(self._n - other._n)
+        return _factoradic_from_digits(Factoradic.subtract_factoradics(self._d, other._d))
+
+    def __rsub__(self, other):
+        other = Factoradic(other) if isinstance(other, integer_types) else _as_factoradic(other)
+        if other is NotImplemented:
+            return other
+        return other - self
+
+    def __mul__(self, other):  # on the numbers, except for small multipliers of digits (multiply_factoradic)
+        if isinstance(other, Factoradic):
+            other = other.to_number()
+        elif not isinstance(other, integer_types):
+            return NotImplemented
+        if other < 0:
+            raise FactoradicException('Factoradic multiplication failed: negative result (not supported)')
+        if self._n is not None or other.bit_length() > ARITHMETIC_DC_THRESHOLD_BITS:
+            return Factoradic.trusted(self.to_number() * other)
+        return _factoradic_from_digits(Factoradic.multiply_factoradic(self._digits, other))
+
+    __rmul__ = __mul__
 
     def length(self):
-        return len(self.v)
+        return len(self._d)
 
     # currently we are not allowing transformations that would make a Factoradic object not well formed
     #def well_formed(self):
     #    return Factoradic.is_well_formed_factoradic(self.v)
 
     def to_number(self):
-        return Factoradic.factoradic_to_number(self.v)
+        if self._n is None:
+            self._n = Factoradic.factoradic_to_number(self._digits)
+        return self._n
 
     def next(self):  # returns a copy, does not modify the object
-        return Factoradic.next_factoradic(self.v)
+        return Factoradic.inc1_well_formed_inplace(self.v)
 
+    # the digits of a Factoradic object are always well formed, so the methods below use the early exit versions of
+    # the carrying and work on the digit array in place: a step of a counter costs O(1) amortised. Without digits, or
+    # with the number known too, the number is updated instead (as well).
     def inc1(self):  # modifies the object (increases the factoradic value by one)
-        if len(self.v) == 1: #  [0] case
-            self.v = [1,0]  # alternatively, inserting 1 to the beginning of [0] is a possibility if that works better
-        else:
-            self.v[len(self.v) - 2] += 1
-            Factoradic.cascade_factoradic_digits_inplace(self.v)
+        self.increment(1)
+
+    def dec1(self):  # modifies the object (decreases the factoradic value by one) - FactoradicException below 0
+        self.decrement(1)
 
     def increment(self, inc):  # modifies the object (increases the factoradic value ) - verifies the parameter
         if isinstance(inc, integer_types):
             if inc == 0:
                 return
             if inc < 0:
-                raise FactoradicException('Factoradic increment failed: negative value (decrement not supported)')
-                #  just convert to integer and back to subtract - since I'm not supporting negative values this is ...
-                #  ... not a useful feature in this lib. If I add negatives in the future I'll add direct subtraction.
-            if len(self.v) == 1:  # [0] case
-                self.v = [0,0]  # prepare to increment
-            self.v[len(self.v) - 2] += inc
-            Factoradic.cascade_factoradic_digits_inplace(self.v)
+                raise FactoradicException('Factoradic increment failed: negative value (use decrement)')
+            if self._digits is not None:
+                carry = _add_from_place_one(self._digits, inc)
+                if carry:  # rare: the number grows past the last factorial, new digits go in front
+                    self._digits = _compact_digits(_carry_digits(carry, len(self._digits)) + self._digits.tolist())
+            if self._n is not None:
+                self._n += inc
         else:
             raise FactoradicException('Factoradic increment failed: expected integer type argument')
 
+    def decrement(self, dec):  # modifies the object (decreases the factoradic value) - verifies the parameter
+        if isinstance(dec, integer_types):
+            if dec == 0:
+                return
+            if dec < 0:
+                raise FactoradicException('Factoradic decrement failed: negative value (use increment)')
+            if self._n is not None and dec > self._n:
+                raise FactoradicException('Factoradic decrement failed: negative result (not supported)')
+            if self._digits is not None:
+                if _subtract_from_place_one(self._digits, dec):
+                    _add_from_place_one(self._digits, dec)  # undo, the digits wrapped around (mod length!): exact
+                    raise FactoradicException('Factoradic decrement failed: negative result (not supported)')
+                if self._digits[0] == 0 and len(self._digits) > 1:  # rare: the number dropped below the first factorial
+                    self._digits = _compact_digits(_strip_leading_zeros(self._digits))
+            if self._n is not None:
+                self._n -= dec
+        else:
+            raise FactoradicException('Factoradic decrement failed: expected integer type argument')
+
+    def to_bytes(self):  # a compact binary record (see the binary format notes) that from_bytes reads back
+        return _digits_to_record(self._d)
+
+    @staticmethod
+    def from_bytes(data, validate=True):  # reads one record from bytes, bytearray, memoryview, mmap...
+        if sys.version_info < (3,):  # pragma: no cover
+            data = bytearray(data)
+        header = _parse_record_header(data, 0)
+        if header is None or header[2] + header[1] * array(header[0]).itemsize > len(data):
+            raise FactoradicException('from_bytes failed: truncated factoradic record')
+        return _record_to_factoradic(data, header[0], header[1], header[2], validate)
+
+    @staticmethod
+    def digits_view(data, offset=0):
+        # zero-copy access to the record at 'offset' of a buffer (bytes, bytearray, mmap...): returns a memoryview of
+        # its digits (most significant first, no validation) and the offset of the next record.
+        # Needs Python3 on a little endian machine, otherwise the view is replaced by a copy (an array).
+        header = _parse_record_header(memoryview(data) if sys.version_info >= (3,) else bytearray(data), offset)
+        if header is None:
+            raise FactoradicException('digits_view failed: truncated factoradic record')
+        typecode, count, start = header
+        end = start + count * array(typecode).itemsize
+        if end > len(data):
+            raise FactoradicException('digits_view failed: truncated factoradic record')
+        if _LITTLE_ENDIAN and sys.version_info >= (3,):
+            return memoryview(data)[start:end].cast(typecode), end
+        return _record_digits(bytearray(data), typecode, count, start), end  # pragma: no cover
+
+    @staticmethod
+    def write_factoradics(fileobj, values):  # writes Factoradics, digit lists or numbers as records, returns the count
+        count = 0
+        for value in values:
+            if isinstance(value, Factoradic):
+                digits = value._d
+            elif isinstance(value, integer_types):
+                digits = _compact_digits(Factoradic.number_to_factoradic(value))
+            else:
+                digits = _compact_digits(value)
+            fileobj.write(_digits_to_record(digits))
+            count += 1
+        return count
+
+    @staticmethod
+    def read_factoradics(fileobj, validate=True, chunk_size=1 << 20):
+        # yields the Factoradics of a file of records, reading it in chunks: memory use depends on the size of the
+        # records, not of the file
+        buff = bytearray()
+        pos = 0
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if pos:
+                del buff[:pos]
+                pos = 0
+            buff += chunk
+            while True:
+                header = _parse_record_header(buff, pos)
+                if header is None:
+                    break
+                typecode, count, start = header
+                end = start + count * array(typecode).itemsize
+                if end > len(buff):
+                    break
+                yield _record_to_factoradic(buff, typecode, count, start, validate)
+                pos = end
+            if not chunk:
+                if pos < len(buff):
+                    raise FactoradicException('read_factoradics failed: truncated factoradic record')
+                return
+
     def permutation(self, elements):  # returns the permutation number Factoradic.v from elements
         return Factoradic.generate_permutation_from_factoradic(self.v, elements)
 
@@ -103,13 +996,51 @@ class Factoradic(object):
 
     @staticmethod
     def number_to_factoradic(value):  # the one I want, with zero as [0], one as [1, 0], no carriage errors
+        value = operator.index(value)  # a Python int, also from NumPy integer scalars (no bit_length)
+        if value.bit_length() > NUMBER_TO_FACTORADIC_DC_THRESHOLD_BITS:
+            return Factoradic.number_to_factoradic_dc(value)
+        return Factoradic.number_to_factoradic_iterative(value)
+
+    @staticmethod
+    def number_to_factoradic_iterative(value):  # one divmod per digit on the whole number - quadratic for huge values
         digits = []
         count = 1
         while value >= count:
-            digits.insert(0, value % count)
+            digits.append(value % count)
             value //= count
             count += 1
-        digits.insert(0, value)
+        digits.append(value)
+        digits.reverse()  # built least significant digit first to avoid repeated insert(0, ...)
+        return digits
+
+    @staticmethod
+    def number_to_factoradic_dc(value):  # divide and conquer on a product tree - same output as the iterative version
+        if value < 2:
+            return Factoradic.number_to_factoradic_iterative(value)
+
+        # find a length n for the result with value < n!. The estimate from lgamma is only off by a little.
+        bits = value.bit_length()
+        n = 2
+        while lgamma(n + 1) / _LN2 < bits - 1:
+            n *= 2
+        low, high = n // 2, n
+        while low < high:  # smallest n with log2(n!) >= bits - 1, a lower bound for the exact length
+            mid = (low + high) // 2
+            if lgamma(mid + 1) / _LN2 < bits - 1:
+                low = mid + 1
+            else:
+                high = mid
+        n = _tree_size(max(low - 1, 2))  # one below, in case of rounding in lgamma
+        tree = cached_product_tree(n)
+        while tree[0] <= value:  # tree[0] == n!
+            n = _tree_size(n + 1)
+            tree = cached_product_tree(n)
+
+        digits = [0] * n  # filled least significant digit first, reversed at the end
+        _split_on_product_tree(value, tree, digits)
+        while digits[-1] == 0:  # the tree can be longer than the result, whose leading digit is never 0
+            digits.pop()
+        digits.reverse()
         return digits
 
     @staticmethod
@@ -143,8 +1074,97 @@ class Factoradic(object):
         return Factoradic.cascade_factoradic_digits_inplace(result)
         # this can be optimised if we deal only with well-formed factoradic_value inputs, because ...
         # ... cascade_factoradic_digits does not make any assumptions. With well-formed factoradics, we can ...
-        # ... stop the cascading at the first digit that doesn't overflow. However in the general case the ...
-        # ... improvement is negligible.
+        # ... stop the cascading at the first digit that doesn't overflow: see inc1_well_formed_inplace.
+
+    @staticmethod
+    def add_factoradics(factoradic_a, factoradic_b):  # digit by digit, for well formed factoradics of any length
+        a, b = factoradic_a[::-1], factoradic_b[::-1]  # by place, least significant first
+        if len(a) < len(b):
+            a, b = b, a
+        res = []
+        carry = 0
+        for place in range3(len(a)):
+            carry += a[place] + (b[place] if place < len(b) else 0)
+            if carry > place:  # place + 1 is the radix
+                res.append(carry % (place + 1))
+                carry //= place + 1
+            else:
+                res.append(carry)
+                carry = 0
+        place = len(a)
+        while carry:
+            res.append(carry % (place + 1))
+            carry //= place + 1
+            place += 1
+        res.reverse()
+        return res
+
+    @staticmethod
+    def subtract_factoradics(factoradic_a, factoradic_b):  # a - b digit by digit, FactoradicException if b > a
+        a, b = factoradic_a[::-1], factoradic_b[::-1]
+        while len(b) > len(a) and b[-1] == 0:  # zero padding in b doesn't matter
+            b = b[:-1]
+        if len(b) > len(a):
+            raise FactoradicException('Factoradic subtraction failed: negative result (not supported)')
+        res = []
+        borrow = 0
+        for place in range3(len(a)):
+            digit = a[place] - (b[place] if place < len(b) else 0) - borrow
+            if digit < 0:
+                digit += place + 1
+                borrow = 1
+            else:
+                borrow = 0
+            res.append(digit)
+        if borrow:
+            raise FactoradicException('Factoradic subtraction failed: negative result (not supported)')
+        res.reverse()
+        return res
+
+    @staticmethod
+    def multiply_factoradic(factoradic_value, multiplier):  # digit by digit with carries, multiplier >= 0
+        res = [digit * multiplier for digit in factoradic_value[::-1]]
+        carry = 0
+        for place in range3(len(res)):
+            carry += res[place]
+            res[place] = carry % (place + 1)
+            carry //= place + 1
+        place = len(res)
+        while carry:
+            res.append(carry % (place + 1))
+            carry //= place + 1
+            place += 1
+        res.reverse()
+        return res
+
+    # early exit versions of next_factoradic / cascade_factoradic_digits_inplace, for trusted well formed digits only:
+    # the carry stops at the first digit that doesn't overflow, so a step costs O(1) amortised instead of O(n).
+    @staticmethod
+    def inc1_well_formed_inplace(factoradic_value):
+        return Factoradic.increment_well_formed_inplace(factoradic_value, 1)
+
+    @staticmethod
+    def dec1_well_formed_inplace(factoradic_value):
+        return Factoradic.decrement_well_formed_inplace(factoradic_value, 1)
+
+    @staticmethod
+    def increment_well_formed_inplace(factoradic_value, inc):  # inc >= 0
+        carry = _add_from_place_one(factoradic_value, inc)
+        if carry:
+            factoradic_value[0:0] = _carry_digits(carry, len(factoradic_value))
+        return factoradic_value
+
+    @staticmethod
+    def decrement_well_formed_inplace(factoradic_value, dec):  # dec >= 0, FactoradicException for negative results
+        if _subtract_from_place_one(factoradic_value, dec):
+            _add_from_place_one(factoradic_value, dec)  # undo
+            raise FactoradicException('decrement failed: negative result (not supported)')
+        first = 0
+        while first < len(factoradic_value) - 1 and factoradic_value[first] == 0:
+            first += 1
+        if first:
+            del factoradic_value[:first]
+        return factoradic_value
 
     @staticmethod
     def is_well_formed_factoradic(factoradic_value):
@@ -155,12 +1175,91 @@ class Factoradic(object):
 
     @staticmethod
     def factoradic_to_number(factoradic_value):
+        if len(factoradic_value) > FACTORADIC_TO_NUMBER_DC_THRESHOLD:
+            return Factoradic.factoradic_to_number_dc(factoradic_value)
+        return Factoradic.factoradic_to_number_iterative(factoradic_value)
+
+    @staticmethod
+    def factoradic_to_number_iterative(factoradic_value):  # Horner's rule - no factorials needed
         res = 0
-        for i in range3(len(factoradic_value) - 1):
-            res += factoradic_value[i] * fact(len(factoradic_value) - 1 - i)
+        place = len(factoradic_value) - 1
+        for i in range3(len(factoradic_value) - 1):  # the last digit (place 0) is ignored, it can only be 0
+            res = (res + factoradic_value[i]) * place
+            place -= 1
+        return res
+
+    @staticmethod
+    def factoradic_to_number_dc(factoradic_value):  # merges halves on a product tree - same output as Horner's rule
+        if len(factoradic_value) < 2:
+            return 0
+        size = _tree_size(len(factoradic_value))
+        digits = list(factoradic_value[::-1])  # indexed by place, least significant digit first
+        digits[0] = 0
+        digits.extend([0] * (size - len(digits)))  # padding to the size of the (shared) product tree
+        return _merge_on_product_tree(digits, cached_product_tree(size))
+
+    @staticmethod
+    def numbers_to_factoradics(values, width=None):
+        # converts many numbers at once into a matrix of factoradics, one row each, all padded to the same width (by
+        # default, the length of the largest one). With NumPy, values that fit in uint64 are converted column by
+        # column with vectorised divmods and a 2-D NumPy array is returned. Otherwise, a list of lists.
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            if values.dtype.kind not in 'ui' or (values.dtype.kind == 'i' and values.size and values.min() < 0):
+                raise FactoradicException('numbers_to_factoradics failed: expected integers >= 0')
+            values = values.astype(numpy.uint64, casting='safe' if values.dtype.kind == 'u' else 'unsafe')
+        else:
+            try:
+                values = [operator.index(value) for value in values]  # any iterable, of integers only
+            except TypeError:
+                raise FactoradicException('numbers_to_factoradics failed: expected integers >= 0')
+            if values and min(values) < 0:
+                raise FactoradicException('numbers_to_factoradics failed: expected integers >= 0')
+            if numpy is not None:
+                try:
+                    values = numpy.asarray(values, dtype=numpy.uint64)
+                except OverflowError:  # too large for uint64: no vectorising
+                    pass
+
+        vectorised = numpy is not None and isinstance(values, numpy.ndarray)
+        if not len(values):
+            top = 0
+        else:
+            top = int(values.max()) if vectorised else max(values)  # ndarray.max doesn't loop in Python
+        largest = Factoradic.number_to_factoradic(top)
+        if width is None:
+            width = len(largest)
+        elif len(largest) > width:
+            raise FactoradicException('numbers_to_factoradics failed: width too small for ' + str(top))
+
+        if not vectorised:
+            return [Factoradic.padded_to_length_s(Factoradic.number_to_factoradic(value), width) for value in values]
 
+        res = numpy.zeros((len(values), width), dtype=numpy.uint8 if width <= 256 else numpy.uint32)
+        remaining = values.copy()
+        for place in range3(1, min(width, len(largest))):  # column for place 0 is always 0, as are the padding ones
+            radix = numpy.uint64(place + 1)
+            res[:, width - 1 - place] = remaining % radix
+            remaining //= radix
         return res
 
+    @staticmethod
+    def factoradics_to_numbers(factoradics):
+        # inverse of numbers_to_factoradics: one number per row of a matrix of (equal width) factoradics. With NumPy
+        # and a width up to NUMPY_MAX_WIDTH, Horner's rule runs column by column and a uint64 array is returned.
+        if numpy is not None:
+            try:
+                matrix = numpy.asarray(factoradics)
+            except ValueError:  # ragged rows (older NumPy versions make a 1-D object array instead)
+                matrix = numpy.empty(0, dtype=object)
+            if matrix.ndim == 2 and matrix.shape[1] <= NUMPY_MAX_WIDTH and matrix.dtype.kind in 'ui':
+                width = matrix.shape[1]
+                res = numpy.zeros(matrix.shape[0], dtype=numpy.uint64)
+                for i in range3(width - 1):
+                    res += matrix[:, i].astype(numpy.uint64)
+                    res *= numpy.uint64(width - 1 - i)
+                return res
+        return [Factoradic.factoradic_to_number([int(digit) for digit in row]) for row in factoradics]
+
     @staticmethod
     def string_to_factoradic(s):
         return list(imap(lambda x: int(x), list(s)))
@@ -168,26 +1267,405 @@ class Factoradic(object):
     @staticmethod
     def generate_permutation_from_factoradic_inplace(factoradic_value, elements):  # modifies 'elements' in place
         res = []
-
-        # this bit makes the permutations cycle through:
-        # permutation number [1, 0, 0, 0] <=> permutation number [0, 0, 0]
-        size_diff = len(factoradic_value) - len(elements)
-        if size_diff > 0:
-            factoradic_value = factoradic_value[size_diff:]
-
-        # factoradic_value needs to be padded to the length of "elements"
-        if size_diff < 0:
-            factoradic_value = Factoradic.padded_to_length_s(factoradic_value, len(elements))
+        factoradic_value = Factoradic.fitted_to_length_s(factoradic_value, len(elements))
 
         # at this point, lengths must match
+        if len(elements) > PERMUTATION_FENWICK_THRESHOLD:
+            res = _select_with_fenwick_tree(factoradic_value, elements)
+            del elements[:]  # same end state as popping every element
+            return res
+
         for i in range3(len(factoradic_value)):
             res.append(elements.pop(factoradic_value[i]))
         return res
 
     @staticmethod
     def generate_permutation_from_factoradic(factoradic_value, elements): # helper to avoid modifying any parameters
+        if len(elements) > PERMUTATION_FENWICK_THRESHOLD:  # no need to copy the elements in this case
+            return Factoradic.generate_permutation_from_factoradic_fenwick(factoradic_value, elements)
         return Factoradic.generate_permutation_from_factoradic_inplace(factoradic_value, elements[:])
 
+    @staticmethod
+    def generate_permutations_from_factoradics(factoradics, elements, out=None):
+        # batch form of generate_permutation_from_factoradic: one permutation of 'elements' per row of a matrix of
+        # factoradics (as returned by numbers_to_factoradics), with the same cycling and padding of the rows.
+        # They are written into 'out' if given - a 2-D NumPy array, or a flat NumPy array or array.array with
+        # len(elements) items per row - which is returned. Otherwise, a new NumPy array (or list of lists).
+        # With NumPy, the rows are decoded all together, one column at a time, in O(len(elements) ** 2) vector steps.
+        n = len(elements)
+        if numpy is None:
+            res = [Factoradic.generate_permutation_from_factoradic([int(digit) for digit in row], elements)
+                   for row in factoradics]
+            if out is None:
+                return res
+            for i, perm in enumerate(res):
+                out[i * n:(i + 1) * n] = type(out)(out.typecode, perm) if hasattr(out, 'typecode') else perm
+            return out
+
+        matrix = numpy.asarray(factoradics, dtype=numpy.intp)
+        if matrix.ndim != 2:
+            raise FactoradicException('generate_permutations_from_factoradics failed: expected a matrix of factoradics')
+        rows, width = matrix.shape
+        if width >= n:  # cycling, as in fitted_to_length_s
+            codes = matrix[:, width - n:].copy()
+        else:  # padding
+            codes = numpy.zeros((rows, n), dtype=numpy.intp)
+            codes[:, n - width:] = matrix
+
+        # each digit counts the available positions before the chosen one, so going from right to left, every
+        # position chosen later is shifted past the ones chosen at its left
+        for i in range3(n - 2, -1, -1):
+            tail = codes[:, i + 1:]
+            tail += tail >= codes[:, i:i + 1]
+        if rows and n and (codes.min() < 0 or codes.max() >= n):
+            raise FactoradicException('generate_permutations_from_factoradics failed: factoradic not well formed')
+
+        perms = numpy.asarray(elements)[codes] if n else numpy.zeros((rows, 0))
+        if out is None:
+            return perms
+        target = out if isinstance(out, numpy.ndarray) else numpy.frombuffer(out, dtype=out.typecode)
+        target.reshape(rows, n)[...] = perms  # a view: this writes into 'out'
+        return out
+
+    @staticmethod
+    def generate_permutation_from_factoradic_fenwick(factoradic_value, elements):  # O(n log n), any size
+        return _select_with_fenwick_tree(Factoradic.fitted_to_length_s(factoradic_value, len(elements)), elements)
+
+    @staticmethod
+    def iter_permutations(elements, start=0, stop=None, reuse_buffer=False):
+        # yields the permutations of 'elements' numbered start, start+1, ... stop-1 (they cycle past len(elements)!).
+        # With no stop, it goes on until the last permutation (the reversed 'elements'). Only the first one is unranked,
+        # then each step is a lexicographic successor on the positions, which changes O(1) items on average.
+        # With reuse_buffer the same list is yielded every time and updated in place (copy it to keep it).
+        if isinstance(start, Factoradic):
+            start = start.to_number()
+        if start < 0:
+            raise FactoradicException('iter_permutations failed: negative start')
+        if stop is not None and stop <= start:
+            return
+        n = len(elements)
+        indices = Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(start),
+                                                                  list(range3(n)))
+        buff = [elements[k] for k in indices]
+        count = None if stop is None else stop - start
+        while True:
+            yield buff if reuse_buffer else buff[:]
+            if count is not None:
+                count -= 1
+                if count == 0:
+                    return
+
+            i = _next_permutation_inplace(indices)
+            if i < 0:  # last permutation reached: cycle back to the first one
+                if count is None:
+                    return
+                indices.reverse()
+                buff.reverse()
+                continue
+            for k in range3(i, n):  # in place, no new list per step
+                buff[k] = elements[indices[k]]
+
+    @staticmethod
+    def parallel_permutations(elements, start, end, map_fn=None, reduce_fn=None, initial=_NO_INITIAL,
+                              chunk_size=None, max_workers=None, ordered=True, executor=None):
+        # splits the ranks [start, end) in contiguous chunks and enumerates each of them with iter_permutations in a
+        # process pool (or in 'executor' if given, which is left running). Yields (chunk_start, chunk_end, result).
+        # The result of a chunk is the list of its permutations, or of map_fn(rank, permutation) for each of them,
+        # folded with reduce_fn (starting from 'initial', if given) when there is a reduce_fn.
+        # Chunks come in rank order if 'ordered', otherwise as they complete. Functions must be picklable.
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED  # 'futures' package in Python2
+        from multiprocessing import cpu_count  # os.cpu_count is Python3 only
+
+        if end <= start:
+            return
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers)
+        workers = max_workers or cpu_count() or 1  # the pool's own size isn't public, so this is an estimate
+        if chunk_size is None:
+            chunk_size = max(1, -(-(end - start) // (workers * 4)))  # a few chunks per worker, to balance the load
+        chunks = ((low, min(low + chunk_size, end)) for low in range3(start, end, chunk_size))
+        max_pending = workers * 2  # bounded, so that huge ranges don't queue up every chunk at once
+        has_initial = initial is not _NO_INITIAL  # compared here: the sentinel doesn't keep its identity in a pickle
+        if not has_initial:
+            initial = None
+        pending = deque() if ordered else {}  # (chunk, future) in rank order, or future -> chunk
+
+        def collect(limit):  # yields finished chunks until at most 'limit' are left pending
+            while len(pending) > limit:
+                if ordered:
+                    chunk, future = pending.popleft()
+                    yield chunk + (future.result(),)
+                else:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future) + (future.result(),)
+
+        try:
+            for chunk in chunks:
+                future = executor.submit(_permutation_chunk, elements, chunk[0], chunk[1], map_fn, reduce_fn, initial,
+                                         has_initial)
+                if ordered:
+                    pending.append((chunk, future))
+                else:
+                    pending[future] = chunk
+                for item in collect(max_pending - 1):
+                    yield item
+            for item in collect(0):
+                yield item
+        finally:  # also reached when the caller stops iterating early
+            for future in (f for _, f in pending) if ordered else pending:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=True)
+
+    @staticmethod
+    def factoradic_from_permutation(permutation, elements):  # inverse of generate_permutation_from_factoradic
+        # returns the digits padded to len(elements), the lowest of the (cycling) factoradics for that permutation
+        return _lehmer_digits(_permutation_indices(permutation, elements))
+
+    @staticmethod
+    def factoradic_from_permutation_fenwick(permutation, elements):  # O(n log n), any size
+        return _rank_with_fenwick_tree(_permutation_indices(permutation, elements))
+
+    @staticmethod
+    def from_permutation(permutation, elements):  # the Factoradic for 'permutation' (of 'elements')
+        return Factoradic(Factoradic.factoradic_from_permutation(permutation, elements) or [0])  # [] for no elements
+
+    # k-permutations: the first k items of the permutations of 'elements', numbered 0 ... n!/(n-k)! - 1 in the same
+    # (lexicographic) order as the full permutations. Digit i of a rank is in base n-i, and picks one of the items not
+    # used yet as with generate_permutation_from_factoradic, with a sparse Fenwick tree: O(k log n), for any n.
+    @staticmethod
+    def count_k_permutations(n, k):  # n! / (n-k)!
+        _check_k(n, k, 'count_k_permutations')
+        return _range_product(n - k, n)
+
+    @staticmethod
+    def generate_k_permutation(rank, elements, k):
+        n = len(elements)
+        _check_k(n, k, 'generate_k_permutation')
+        if not 0 <= rank < _range_product(n - k, n):
+            raise FactoradicException('generate_k_permutation failed: rank out of range')
+        digits = [0] * k
+        for i in range3(k - 1, -1, -1):
+            rank, digits[i] = divmod(rank, n - i)
+        tree = {}
+        res = []
+        for digit in digits:
+            index = _sparse_tree_select(tree, n, digit)
+            _sparse_tree_add(tree, n, index, 1)
+            res.append(elements[index])
+        return res
+
+    @staticmethod
+    def rank_k_permutation(k_permutation, elements):  # inverse of generate_k_permutation (k = len(k_permutation))
+        # finding the items costs O(n) once, unless elements is a range
+        n = len(elements)
+        _check_k(n, len(k_permutation), 'rank_k_permutation')
+        tree = {}
+        rank = 0
+        for i, index in enumerate(_item_indices(k_permutation, elements, 'rank_k_permutation')):
+            rank = rank * (n - i) + index - _sparse_tree_taken_below(tree, index)
+            _sparse_tree_add(tree, n, index, 1)
+        return rank
+
+    @staticmethod
+    def iter_k_permutations(elements, k, start=0, stop=None):
+        # yields the k-permutations numbered start ... stop-1 (by default, up to the last one). Only the first one is
+        # unranked, then each step increments the digits: O(log n) amortised, as few digits change on average.
+        n = len(elements)
+        total = Factoradic.count_k_permutations(n, k)
+        stop = total if stop is None else min(stop, total)
+        if stop <= start:
+            return
+        buff = Factoradic.generate_k_permutation(start, range3(n), k)  # the indices, turned into items below
+        digits = [0] * k
+        tree = {}
+        for i, index in enumerate(buff):
+            digits[i] = index - _sparse_tree_taken_below(tree, index)
+            _sparse_tree_add(tree, n, index, 1)
+        indices = buff
+        buff = [elements[index] for index in indices]
+        for _ in range3(start, stop - 1):
+            yield buff[:]
+            i = k - 1
+            while digits[i] == n - i - 1:  # the last rank isn't reached, so some digit can grow
+                i -= 1
+            for j in range3(i, k):
+                _sparse_tree_add(tree, n, indices[j], -1)
+            digits[i] += 1
+            digits[i + 1:] = [0] * (k - i - 1)
+            for j in range3(i, k):
+                indices[j] = _sparse_tree_select(tree, n, digits[j])
+                _sparse_tree_add(tree, n, indices[j], 1)
+                buff[j] = elements[indices[j]]
+        yield buff[:]
+
+    # combinations: the k-subsets of 'elements', as the items in the order of 'elements', numbered by the
+    # combinatorial number system (combinadic): the subset at positions c1 < c2 < ... < ck has the rank
+    # C(c1, 1) + C(c2, 2) + ... + C(ck, k), which orders the subsets colexicographically.
+    @staticmethod
+    def count_combinations(n, k):  # n choose k
+        _check_k(n, k, 'count_combinations')
+        return _binomial(n, k)
+
+    @staticmethod
+    def generate_combination(rank, elements, k):  # O(k log n) binomials, each position found by bisection
+        n = len(elements)
+        _check_k(n, k, 'generate_combination')
+        if not 0 <= rank < _binomial(n, k):
+            raise FactoradicException('generate_combination failed: rank out of range')
+        res = [None] * k
+        high = n  # positions are below the one chosen for the next larger place
+        for place in range3(k, 0, -1):
+            low = place - 1  # the largest c with C(c, place) <= rank, in [low, high)
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _binomial(middle, place) <= rank:
+                    low = middle
+                else:
+                    high = middle
+            rank -= _binomial(low, place)
+            res[place - 1] = elements[low]
+            high = low
+        return res
+
+    @staticmethod
+    def rank_combination(combination, elements):  # inverse of generate_combination, the items in any order
+        _check_k(len(elements), len(combination), 'rank_combination')
+        indices = sorted(_item_indices(combination, elements, 'rank_combination'))
+        return sum(_binomial(index, place + 1) for place, index in enumerate(indices))
+
+    @staticmethod
+    def iter_combinations(elements, k, start=0, stop=None):
+        # yields the combinations numbered start ... stop-1 (by default, up to the last one). Only the first one is
+        # unranked, then each step is the colexicographic successor: O(1) amortised.
+        n = len(elements)
+        total = Factoradic.count_combinations(n, k)
+        stop = total if stop is None else min(stop, total)
+        if stop <= start:
+            return
+        indices = Factoradic.generate_combination(start, range3(n), k)
+        buff = [elements[index] for index in indices]
+        for _ in range3(start, stop - 1):
+            yield buff[:]
+            i = 0
+            while i < k - 1 and indices[i] + 1 == indices[i + 1]:  # the last rank isn't reached: some position moves
+                i += 1
+            indices[i] += 1
+            buff[i] = elements[indices[i]]
+            for j in range3(i):
+                indices[j] = j
+                buff[j] = elements[j]
+        yield buff[:]
+
+    # multiset permutations: the different arrangements of 'elements' when it has repeated values, each one once,
+    # numbered 0 ... n! / (c1! c2! ...) - 1 in lexicographic order, values ordered by their first occurrence in
+    # 'elements'. With m items left, the arrangements starting with a value of count c are a block of total * c / m:
+    # the block is found with a Fenwick tree over the counts and the total is updated by that same ratio, in O(n log d)
+    # for d different values.
+    @staticmethod
+    def count_multiset_permutations(elements):
+        return _multinomial(_multiset(elements)[1])
+
+    @staticmethod
+    def generate_multiset_permutation(rank, elements):
+        values, counts, _ = _multiset(elements)
+        total = _multinomial(counts)
+        if not 0 <= rank < total:
+            raise FactoradicException('generate_multiset_permutation failed: rank out of range')
+        tree = _fenwick_tree_from_counts(counts)
+        res = []
+        for m in range3(len(elements), 0, -1):
+            value, before = _fenwick_tree_select(tree, rank * m // total)
+            rank -= total * before // m
+            total = total * counts[value] // m
+            counts[value] -= 1
+            _fenwick_tree_add(tree, value, -1)
+            res.append(values[value])
+        return res
+
+    @staticmethod
+    def rank_multiset_permutation(permutation, elements):  # inverse of generate_multiset_permutation
+        if len(permutation) != len(elements):
+            raise FactoradicException('rank_multiset_permutation failed: permutation and elements differ in length')
+        _, counts, positions = _multiset(elements)
+        total = _multinomial(counts)
+        tree = _fenwick_tree_from_counts(counts)
+        rank = 0
+        for m in range3(len(permutation), 0, -1):
+            value = positions.get(permutation[len(permutation) - m])
+            if value is None or counts[value] == 0:
+                raise FactoradicException('rank_multiset_permutation failed: not a permutation of elements')
+            rank += total * _fenwick_tree_prefix(tree, value) // m
+            total = total * counts[value] // m
+            counts[value] -= 1
+            _fenwick_tree_add(tree, value, -1)
+        return rank
+
+    @staticmethod
+    def iter_multiset_permutations(elements, start=0, stop=None):
+        # yields the multiset permutations numbered start ... stop-1 (by default, up to the last one). Only the first
+        # one is unranked, then each step is the lexicographic successor, as in iter_permutations.
+        values, _, positions = _multiset(elements)
+        codes = [positions[x] for x in elements]  # values as their positions, which keeps their order
+        total = Factoradic.count_multiset_permutations(codes)
+        stop = total if stop is None else min(stop, total)
+        if stop <= start:
+            return
+        codes = Factoradic.generate_multiset_permutation(start, codes)
+        buff = [values[code] for code in codes]
+        for _ in range3(start, stop - 1):
+            yield buff[:]
+            i = _next_permutation_inplace(codes)  # the last one isn't reached
+            buff[i:] = [values[code] for code in codes[i:]]
+        yield buff[:]
+
+    # permutation algebra on ranks: the permutations of range(n), numbered as by generate_permutation_from_factoradic.
+    # Ranks are numbers or Factoradics, and the result is of the type of the first one. Each operation unranks, works
+    # on the positions and ranks again: O(n log n) with the Fenwick tree engines for large n - plus the conversions
+    # between numbers and digits, which Factoradics holding digits skip (their results hold digits only, too).
+    @staticmethod
+    def compose_permutation_ranks(rank_a, rank_b, n):  # the permutation c with c[i] == a[b[i]]
+        a = _indices_of_rank(rank_a, n, 'compose_permutation_ranks')
+        b = _indices_of_rank(rank_b, n, 'compose_permutation_ranks')
+        return _rank_of_indices([a[i] for i in b], rank_a)
+
+    @staticmethod
+    def inverse_permutation_rank(rank, n):
+        res = [0] * n
+        for i, index in enumerate(_indices_of_rank(rank, n, 'inverse_permutation_rank')):
+            res[index] = i
+        return _rank_of_indices(res, rank)
+
+    @staticmethod
+    def power_permutation_rank(rank, n, exponent):  # any integer exponent, through the (cached) cycle decomposition
+        res = [0] * n
+        for cycle in _cached_cycles(rank, n):
+            shift = exponent % len(cycle)
+            for j, i in enumerate(cycle):
+                res[i] = cycle[(j + shift) % len(cycle)]
+        return _rank_of_indices(res, rank)
+
+    @staticmethod
+    def permutation_parity(rank, n):  # 0 for even permutations, 1 for odd: the digits sum up the inversions
+        return sum(_digits_of_rank(rank, n, 'permutation_parity')) % 2
+
+    @staticmethod
+    def permutation_sign(rank, n):  # 1 or -1
+        return 1 - 2 * Factoradic.permutation_parity(rank, n)
+
+    @staticmethod
+    def fitted_to_length_s(factoradic_value, new_len):
+        # this bit makes the permutations cycle through:
+        # permutation number [1, 0, 0, 0] <=> permutation number [0, 0, 0]
+        size_diff = len(factoradic_value) - new_len
+        if size_diff > 0:
+            return factoradic_value[size_diff:]
+
+        # factoradic_value needs to be padded to the length of "elements"
+        return Factoradic.padded_to_length_s(factoradic_value, new_len)
+
     @staticmethod
     def padded_to_length_s(factoradic_value, new_len):
         if len(factoradic_value) < new_len:
@@ -198,11 +1676,473 @@ class Factoradic(object):
         return factoradic_value
 
 
-if __name__ == "__main__":
-    import tests
+class FactoradicStore(object):
+    # A file of fixed-width records - factoradics, or permutations as positions in the list of elements - read through
+    # mmap, so that any record or range of records can be read without loading the file. Record i is for rank
+    # first_rank + i. Layout: the header (magic, version, kind, digit width in bytes, record length, record count and
+    # header size), the first rank as a binary record (Factoradic.to_bytes), padding, then the records back to back,
+    # every digit a little endian unsigned integer of the same width (as in _compact_digits for the record length).
+    MAGIC = b'FDST'
+    VERSION = 1
+    KINDS = ('factoradic', 'permutation')
+    _header = struct.Struct(str('<4sBBBxIQI'))
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise FactoradicException('FactoradicStore failed: not a store file: ' + repr(path))
+        if len(self._mmap) < self._header.size or self._mmap[:4] != self.MAGIC:
+            self.close()
+            raise FactoradicException('FactoradicStore failed: not a store file: ' + repr(path))
+        _, version, kind, width, self.record_length, self.count, self._start = \
+            self._header.unpack_from(self._mmap, 0)
+        if version != self.VERSION or kind >= len(self.KINDS) or width not in _WIDTH_TYPECODES:
+            self.close()
+            raise FactoradicException('FactoradicStore failed: unsupported store file: ' + repr(path))
+        self.kind = self.KINDS[kind]
+        try:
+            self.first_rank = Factoradic.from_bytes(self._mmap[self._header.size:self._start]).to_number()
+        except Exception:  # a damaged first rank: don't leave the file open
+            self.close()
+            raise
+        self._typecode = _WIDTH_TYPECODES[width]
+        self._record_bytes = self.record_length * width
+        if self._start + self.count * self._record_bytes > len(self._mmap):
+            self.close()
+            raise FactoradicException('FactoradicStore failed: truncated store file: ' + repr(path))
+
+    @staticmethod
+    def write(path, records, record_length, kind='factoradic', first_rank=0):
+        # writes the records (digit lists, Factoradics or permutations of range(record_length)), shorter factoradics
+        # are padded with padded_to_length_s. Returns the number of records.
+        if kind not in FactoradicStore.KINDS:
+            raise FactoradicException('FactoradicStore.write failed: unknown kind ' + repr(kind))
+        typecode = _compact_digits([0] * record_length).typecode
+        width = array(typecode).itemsize
+        rank_record = Factoradic(first_rank).to_bytes()
+        start = FactoradicStore._header.size + len(rank_record)
+        start += -start % width  # records aligned to the digit width
+        count = 0
+        with open(path, 'wb') as f:
+            f.write(b'\0' * start)  # the header goes in last, once the count is known
+            for record in records:
+                digits = record.v if isinstance(record, Factoradic) else list(record)
+                if len(digits) > record_length:
+                    raise FactoradicException('FactoradicStore.write failed: record longer than record_length')
+                if kind == 'permutation':
+                    if len(digits) != record_length or sorted(set(digits)) != list(range3(record_length)):
+                        raise FactoradicException('FactoradicStore.write failed: not a permutation of range(' +
+                                                  str(record_length) + ')')
+                else:
+                    digits = Factoradic.padded_to_length_s(digits, record_length)
+                    if not isinstance(record, Factoradic) and (min(digits or [0]) < 0 or
+                                                               not Factoradic.is_well_formed_factoradic(digits)):
+                        raise FactoradicException('FactoradicStore.write failed: factoradic not well formed')
+                digits = array(typecode, digits)
+                if not _LITTLE_ENDIAN:  # pragma: no cover
+                    digits.byteswap()
+                f.write(digits.tobytes() if hasattr(digits, 'tobytes') else digits.tostring())
+                count += 1
+            f.seek(0)
+            f.write(FactoradicStore._header.pack(FactoradicStore.MAGIC, FactoradicStore.VERSION,
+                                                 FactoradicStore.KINDS.index(kind), width, record_length, count, start))
+            f.write(rank_record)
+        return count
+
+    @staticmethod
+    def build(path, record_length, start, stop, kind='factoradic'):
+        # writes the factoradics (or the permutations of range(record_length)) for the ranks [start, stop)
+        if kind == 'permutation':
+            records = Factoradic.iter_permutations(list(range3(record_length)), start, stop, reuse_buffer=True)
+        else:
+            records = _factoradic_range(start, stop)
+        return FactoradicStore.write(path, records, record_length, kind, start)
+
+    def __len__(self):
+        return self.count
+
+    def _read(self, first, last):  # digits of the records [first, last) in one array
+        offset = self._start + first * self._record_bytes
+        digits = array(self._typecode)
+        payload = self._mmap[offset:offset + (last - first) * self._record_bytes]
+        if hasattr(digits, 'frombytes'):
+            digits.frombytes(payload)
+        else:  # pragma: no cover
+            digits.fromstring(payload)
+        if not _LITTLE_ENDIAN:  # pragma: no cover
+            digits.byteswap()
+        return digits
+
+    def __getitem__(self, index):  # a record as a list, or a list of records for a slice (by position in the file)
+        if isinstance(index, slice):
+            first, last, step = index.indices(self.count)
+            if step != 1:
+                return [self[i] for i in range3(first, last, step)]
+            digits = self._read(first, max(first, last)).tolist()
+            n = self.record_length
+            return [digits[i:i + n] for i in range3(0, len(digits), n)]
+        index = self._position(index)
+        return self._read(index, index + 1).tolist()
+
+    def _position(self, index):  # a record index, counted from the end if negative as for lists
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('FactoradicStore index out of range')
+        return index
+
+    def by_rank(self, rank):
+        if not 0 <= rank - self.first_rank < self.count:
+            raise IndexError('FactoradicStore rank out of range')
+        return self[rank - self.first_rank]
+
+    def permutation(self, rank, elements):  # the permutation record for 'rank', applied to 'elements'
+        if self.kind != 'permutation':
+            raise FactoradicException('FactoradicStore.permutation failed: not a permutation store')
+        return [elements[i] for i in self.by_rank(rank)]
+
+    def view(self, index):  # zero-copy memoryview of a record (Python3, little endian), release it before close()
+        index = self._position(index)
+        offset = self._start + index * self._record_bytes
+        return memoryview(self._mmap)[offset:offset + self._record_bytes].cast(self._typecode)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _sampler_key(parts):  # unambiguous text for the seed and stream path: every part tagged with its type and length
+    key = []
+    for part in parts:
+        kind = 'int' if isinstance(part, integer_types) else 'str' if isinstance(part, unicode) else type(part).__name__
+        text = unicode(part)
+        key.append(kind + ':' + unicode(len(text)) + ':' + text)
+    return ','.join(key)
+
 
-    suite = tests.unittest.TestLoader().loadTestsFromTestCase(tests.TestCaseFactoradicLowlevel)
-    suite.addTests(tests.unittest.TestLoader().loadTestsFromTestCase(tests.TestCaseFactoradicObject))
-    tests.unittest.TextTestRunner(verbosity=2).run(suite)
+class PermutationSampler(object):
+    # Uniform random permutations of n items, drawn as factoradic digits - digit i uniform below n-i, one draw per
+    # radix - so neither n! nor a random number below it is ever built. Streams are reproducible: the same seed and
+    # stream give the same samples in any process, and spawn(i) makes independent child streams (seeded from a
+    # SHA-256 of the seed and the path of stream indices) for parallel workers. With seed None a random one is picked,
+    # readable in .seed to reproduce the run. batch() has a NumPy path (when installed, and n <= NUMPY_MAX_WIDTH so
+    # that ranks fit in uint64) which draws from its own generator, so its samples differ from the one by one ones.
+    def __init__(self, n, seed=None, stream=()):
+        if n < 0:
+            raise FactoradicException('PermutationSampler failed: negative size')
+        self.n = n
+        self.seed = random.SystemRandom().getrandbits(128) if seed is None else seed
+        self.stream = tuple(stream)
+        key = _sampler_key((self.seed,) + self.stream)
+        self._seed = int(hashlib.sha256(key.encode('utf-8')).hexdigest(), 16)
+        self._random = random.Random(self._seed)
+        self._numpy_generator = None
 
-    tests.unittest.TestSuite(tests.suite())
+    def spawn(self, index):  # the child stream 'index' of this one (sampling from this one doesn't change it)
+        return PermutationSampler(self.n, self.seed, self.stream + (index,))
+
+    def _elements(self, elements):
+        if elements is None:
+            return list(range3(self.n))
+        if len(elements) != self.n:
+            raise FactoradicException('PermutationSampler failed: expected ' + str(self.n) + ' elements')
+        return elements
+
+    def factoradic(self):  # n digits, padded as factoradic_from_permutation returns them
+        randrange = self._random.randrange
+        return [randrange(radix) for radix in range3(self.n, 0, -1)]
+
+    def rank(self):
+        return Factoradic.factoradic_to_number(self.factoradic())
+
+    def permutation(self, elements=None):
+        return Factoradic.generate_permutation_from_factoradic(self.factoradic(), self._elements(elements))
+
+    def sample(self, elements=None):  # (rank, permutation) of the same draw
+        digits = self.factoradic()
+        return (Factoradic.factoradic_to_number(digits),
+                Factoradic.generate_permutation_from_factoradic(digits, self._elements(elements)))
+
+    def batch(self, count, elements=None):
+        # (ranks, permutations) of 'count' samples: NumPy arrays (uint64 ranks, one permutation per row) on the NumPy
+        # path, otherwise lists
+        elements = self._elements(elements)
+        if numpy is not None and self.n <= NUMPY_MAX_WIDTH and hasattr(numpy.random, 'default_rng'):  # NumPy 1.17+
+            if self._numpy_generator is None:
+                self._numpy_generator = numpy.random.default_rng(self._seed)
+            digits = self._numpy_generator.integers(0, numpy.arange(self.n, 0, -1), size=(count, self.n),
+                                                    dtype=numpy.uint8)
+            return (Factoradic.factoradics_to_numbers(digits),
+                    Factoradic.generate_permutations_from_factoradics(digits, elements))
+        samples = [self.sample(elements) for _ in range3(count)]
+        return [rank for rank, _ in samples], [perm for _, perm in samples]
+
+
+# >>> instrumentation
+# Opt-in counters and latency histograms for the static methods of Factoradic. enable_instrumentation replaces them
+# with timed wrappers and disable_instrumentation puts the originals back, so nothing runs on the call path while it
+# is disabled. Generators (iter_permutations...) aren't wrapped: their calls return before doing any work.
+# Stats are kept per method and per size bucket: the first argument's length rounded up to a power of two (the
+# digits for most methods, the items for the batch ones), estimated from the bit length for numbers.
+_instrumentation_lock = threading.Lock()
+_instrumentation_originals = {}  # method name -> the original staticmethod, while enabled
+_instrumentation_stats = {}  # (method name, size bucket) -> stats dict, see instrumentation_snapshot
+_instrumentation_state = {'callback': None}
+_timer = getattr(time, 'perf_counter', time.time)  # Python 3.3+
+# _BITS_PER_BUCKET[k]: bits of (2 ** k)!, the largest numbers with at most 2 ** k digits
+_BITS_PER_BUCKET = [lgamma((1 << k) + 1) / _LN2 for k in range3(64)]
+
+
+def _size_bucket(arg):  # 0, 1, 2, 4, 8... the smallest power of two at or above the size of 'arg'
+    if isinstance(arg, integer_types):
+        return 1 << bisect_left(_BITS_PER_BUCKET, arg.bit_length()) if arg > 0 else 1
+    try:
+        size = len(arg)
+    except TypeError:
+        size = arg.length() if isinstance(arg, Factoradic) else 0
+    return 1 << (size - 1).bit_length() if size else 0
+
+
+def _record_call(name, bucket, seconds, failed):
+    latency = 1 << int(seconds * 1e6).bit_length()  # upper bound in microseconds
+    with _instrumentation_lock:
+        stats = _instrumentation_stats.get((name, bucket))
+        if stats is None:
+            stats = _instrumentation_stats[(name, bucket)] = {'calls': 0, 'errors': 0, 'total_seconds': 0.0,
+                                                               'max_seconds': 0.0, 'latency_us': {}}
+        stats['calls'] += 1
+        stats['errors'] += failed
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['latency_us'][latency] = stats['latency_us'].get(latency, 0) + 1
+    callback = _instrumentation_state['callback']
+    if callback is not None:
+        callback(name, bucket, seconds, failed)
+
+
+def _instrumented(name, fn):
+    @wraps(fn)  # same name and qualified name as the original, so that it can be pickled (by reference) too
+    def wrapper(*args, **kwargs):
+        bucket = _size_bucket(args[0]) if args else 0
+        failed = True
+        start = _timer()
+        try:
+            res = fn(*args, **kwargs)
+            failed = False
+            return res
+        finally:
+            _record_call(name, bucket, _timer() - start, failed)
+    return wrapper
+
+
+def enable_instrumentation(callback=None):
+    # callback(method name, size bucket, seconds, failed) is called after every call, to export metrics - it runs in
+    # the caller's thread, keep it fast. Calling this again while enabled only changes the callback.
+    with _instrumentation_lock:
+        _instrumentation_state['callback'] = callback
+        if _instrumentation_originals:
+            return
+        for name, member in list(Factoradic.__dict__.items()):
+            if isinstance(member, staticmethod) and not inspect.isgeneratorfunction(member.__func__):
+                _instrumentation_originals[name] = member
+                setattr(Factoradic, name, staticmethod(_instrumented(name, member.__func__)))
+
+
+def disable_instrumentation():  # the stats are kept, see reset_instrumentation
+    with _instrumentation_lock:
+        for name, member in _instrumentation_originals.items():
+            setattr(Factoradic, name, member)
+        _instrumentation_originals.clear()
+        _instrumentation_state['callback'] = None
+
+
+def instrumentation_enabled():
+    return bool(_instrumentation_originals)
+
+
+def instrumentation_snapshot():
+    # a copy of the stats: {method name: {size bucket: {'calls', 'errors', 'total_seconds', 'max_seconds',
+    # 'latency_us': {upper bound in microseconds (a power of two): calls}}}}
+    with _instrumentation_lock:
+        snapshot = {}
+        for (name, bucket), stats in _instrumentation_stats.items():
+            stats = dict(stats)
+            stats['latency_us'] = dict(stats['latency_us'])
+            snapshot.setdefault(name, {})[bucket] = stats
+        return snapshot
+
+
+def reset_instrumentation():
+    with _instrumentation_lock:
+        _instrumentation_stats.clear()
+# <<< instrumentation
+
+
+# >>> command line
+def _cli_parse_elements(args):
+    if args.elements is not None:
+        return args.elements.split(',')
+    if args.size is not None:
+        return list(range3(args.size))
+    raise FactoradicException('--elements or --size is required for ' + args.command)
+
+
+def _cli_convert(command, items, binary, elements, width, sep):
+    # converts one chunk of input: text lines, or digit lists when the input is binary. Returns the output as bytes.
+    # Module level (and plain arguments) so that it can run in worker processes. Bad input raises FactoradicException
+    # naming the first bad item of the chunk.
+    try:
+        return _cli_convert_items(command, items, binary, elements, width, sep)
+    except (ValueError, FactoradicException):
+        for item in items:  # the chunk failed: find out which item did it
+            try:
+                _cli_convert_items(command, [item], binary, elements, width, sep)
+            except (ValueError, FactoradicException) as error:
+                item = item.rstrip('\r\n') if isinstance(item, unicode) else item
+                raise FactoradicException('bad input ' + repr(item) + ': ' + unicode(error))
+        raise
+
+
+def _cli_convert_items(command, items, binary, elements, width, sep):
+    if command == 'to-factoradic':
+        values = [int(line) for line in items]
+        rows = [[int(digit) for digit in row] for row in Factoradic.numbers_to_factoradics(values, width)]
+        if width is None:  # each one as short as possible, as number_to_factoradic would give it
+            rows = [row[next((i for i, d in enumerate(row) if d), len(row) - 1):] for row in rows]
+        if binary:
+            return b''.join(_digits_to_record(_compact_digits(row)) for row in rows)
+        out = [' '.join(str(digit) for digit in row) for row in rows]
+    elif command == 'to-number':
+        if not binary:
+            items = [[int(digit) for digit in line.replace(',', ' ').split()] for line in items]
+        longest = max(len(digits) for digits in items) if items else 0
+        numbers = Factoradic.factoradics_to_numbers([Factoradic.padded_to_length_s(digits, longest)
+                                                     for digits in items])
+        out = [str(int(number)) for number in numbers]
+    elif command == 'unrank' and len(elements) > NUMPY_MAX_WIDTH:
+        # one by one: the batch form works on a rows x n matrix, with O(rows * n ** 2) steps - only for small n
+        rows = items if binary else (Factoradic.number_to_factoradic(int(line)) for line in items)
+        perms = [Factoradic.generate_permutation_from_factoradic(list(digits), elements) for digits in rows]
+        out = [sep.join(str(x) for x in perm) for perm in perms]
+    elif command == 'unrank':
+        if binary:
+            longest = max(len(digits) for digits in items) if items else 0
+            matrix = [Factoradic.padded_to_length_s(digits, longest) for digits in items]
+        else:
+            matrix = Factoradic.numbers_to_factoradics([int(line) for line in items])
+        perms = Factoradic.generate_permutations_from_factoradics(matrix, elements) if len(matrix) else []
+        out = [sep.join(str(x) for x in perm) for perm in perms]
+    else:  # rank
+        numeric = elements and not isinstance(elements[0], unicode)  # from --size
+        digits = []
+        for line in items:
+            perm = line.replace(',', ' ').split() if sep is None else line.rstrip('\r\n').split(sep)
+            if numeric:
+                perm = [int(x) for x in perm]
+            digits.append(Factoradic.factoradic_from_permutation(perm, elements))
+        if binary:
+            return b''.join(_factoradic_from_digits(d or [0]).to_bytes() for d in digits)
+        out = [str(Factoradic.factoradic_to_number(d)) for d in digits]
+    return ''.join(line + '\n' for line in out).encode('utf-8')
+
+
+def _cli_chunks(args, stdin):  # the input in chunks of args.chunk_size items, read lazily
+    from itertools import islice
+    if args.binary and args.command in ('to-number', 'unrank'):
+        items = (f.v for f in Factoradic.read_factoradics(stdin))
+    else:
+        items = (line.decode('utf-8') for line in stdin if line.strip())
+    while True:
+        chunk = list(islice(items, args.chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def main(argv=None, stdin=None, stdout=None, stderr=None):
+    # python -m factoradic COMMAND [options] < input > output - see python -m factoradic --help. Stops at the first
+    # bad input item, after the output of the chunks before it, and returns 1.
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m factoradic',
+                                     description='Bulk conversions between numbers, factoradics and permutations. '
+                                                 'Reads one item per line (or binary records) from stdin.')
+    commands = parser.add_subparsers(dest='command')
+    helps = {'to-factoradic': 'numbers to factoradics (digits separated by spaces)',
+             'to-number': 'factoradics (digits separated by spaces or commas) to numbers',
+             'unrank': 'ranks to permutations of the elements',
+             'rank': 'permutations of the elements to ranks',
+             'test': 'run the unit tests'}
+    for name in ('to-factoradic', 'to-number', 'unrank', 'rank', 'test'):
+        command = commands.add_parser(name, help=helps[name])
+        if name == 'test':
+            continue
+        command.add_argument('--binary', action='store_true',
+                             help='factoradics (and ranks) as binary records (see Factoradic.to_bytes) instead of text')
+        command.add_argument('--chunk-size', type=int, default=1 << 16, help='items converted at once')
+        command.add_argument('--workers', type=int, default=0, help='worker processes (default: none)')
+        if name == 'to-factoradic':
+            command.add_argument('--width', type=int, help='pad every factoradic to this many digits')
+        if name in ('unrank', 'rank'):
+            command.add_argument('--elements', help='the elements, separated by commas')
+            command.add_argument('--size', type=int, help='the elements are 0, 1, ... SIZE-1')
+            command.add_argument('--sep', default=None,
+                                 help='separator of the elements of a permutation (default: space, or commas)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'test':
+        import tests
+        suite = tests.unittest.TestLoader().loadTestsFromTestCase(tests.TestCaseFactoradicLowlevel)
+        suite.addTests(tests.unittest.TestLoader().loadTestsFromTestCase(tests.TestCaseFactoradicObject))
+        suite.addTests(tests.unittest.TestLoader().loadTestsFromTestCase(tests.TestCaseFactoradicAsync))
+        return 0 if tests.unittest.TextTestRunner(verbosity=2).run(suite).wasSuccessful() else 1
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    stdin = stdin if stdin is not None else getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = stdout if stdout is not None else getattr(sys.stdout, 'buffer', sys.stdout)
+    stderr = stderr if stderr is not None else sys.stderr
+    elements, sep = None, None
+    if args.command in ('unrank', 'rank'):
+        elements = _cli_parse_elements(args)
+        sep = ' ' if args.sep is None and args.command == 'unrank' else args.sep
+    options = (args.binary, elements, getattr(args, 'width', None), sep)
+
+    try:
+        if args.workers <= 0:
+            for chunk in _cli_chunks(args, stdin):
+                stdout.write(_cli_convert(args.command, chunk, *options))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(args.workers) as executor:
+                pending = deque()  # in input order, at most two chunks per worker so that memory use stays flat
+                try:
+                    for chunk in _cli_chunks(args, stdin):
+                        pending.append(executor.submit(_cli_convert, args.command, chunk, *options))
+                        if len(pending) >= 2 * args.workers:
+                            stdout.write(pending.popleft().result())
+                    while pending:
+                        stdout.write(pending.popleft().result())
+                finally:  # after an error, don't wait for the chunks that come after it
+                    for future in pending:
+                        future.cancel()
+    except FactoradicException as error:
+        stdout.flush()
+        stderr.write('python -m factoradic: ' + unicode(error) + '\n')
+        return 1
+    stdout.flush()
+    return 0
+# <<< command line
+
+
+if __name__ == "__main__":
+    sys.exit(main())
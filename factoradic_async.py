@@ -0,0 +1,80 @@
+# asyncio counterparts of the conversions in factoradic (Python 3.5+ only, so they live in their own module).
+# Small inputs are converted inline, large ones are sent to an executor so that they don't block the event loop.
+import asyncio
+import weakref
+
+from factoradic import Factoradic, NUMBER_TO_FACTORADIC_DC_THRESHOLD_BITS
+
+
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)  # Python 3.7+, or the older name
+
+
+# size estimates, all in bits of the number involved (a permutation of n elements has a rank of about n log2 n bits)
+def _number_cost(value):
+    return value.bit_length()
+
+
+def _digits_cost(length):
+    return length * max(1, length.bit_length() - 1)
+
+
+class AsyncConverter(object):
+    # executor: None for the event loop's default thread pool, or any concurrent.futures executor (a process pool
+    # avoids the GIL, but the arguments and results are then pickled). Calls estimated above inline_max_cost bits
+    # are sent to the executor, at most max_concurrency at the same time - the others wait for their turn.
+    # Cancelling a call that waits, or whose work hasn't started, drops it; work already running in a thread can't be
+    # interrupted, its result is just discarded.
+    def __init__(self, executor=None, max_concurrency=4, inline_max_cost=NUMBER_TO_FACTORADIC_DC_THRESHOLD_BITS):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.inline_max_cost = inline_max_cost
+        self._semaphores = weakref.WeakKeyDictionary()  # one per event loop, created on first use in it
+        self.inline_calls = 0
+        self.offloaded_calls = 0
+
+    async def _run(self, cost, fn, *args):
+        if cost <= self.inline_max_cost:
+            self.inline_calls += 1
+            return fn(*args)
+        loop = _running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            self.offloaded_calls += 1
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def number_to_factoradic(self, value):
+        return await self._run(_number_cost(value), Factoradic.number_to_factoradic, value)
+
+    async def factoradic_to_number(self, factoradic_value):
+        return await self._run(_digits_cost(len(factoradic_value)), Factoradic.factoradic_to_number,
+                               list(factoradic_value))
+
+    async def generate_permutation_from_factoradic(self, factoradic_value, elements):  # unranking
+        return await self._run(_digits_cost(len(elements)), Factoradic.generate_permutation_from_factoradic,
+                               list(factoradic_value), elements)
+
+    async def factoradic_from_permutation(self, permutation, elements):  # ranking
+        return await self._run(_digits_cost(len(elements)), Factoradic.factoradic_from_permutation, permutation,
+                               elements)
+
+
+_default_converter = AsyncConverter()
+
+
+# module level shortcuts, with the default converter (the loop's thread pool, 4 at a time)
+async def number_to_factoradic(value):
+    return await _default_converter.number_to_factoradic(value)
+
+
+async def factoradic_to_number(factoradic_value):
+    return await _default_converter.factoradic_to_number(factoradic_value)
+
+
+async def generate_permutation_from_factoradic(factoradic_value, elements):
+    return await _default_converter.generate_permutation_from_factoradic(factoradic_value, elements)
+
+
+async def factoradic_from_permutation(permutation, elements):
+    return await _default_converter.factoradic_from_permutation(permutation, elements)
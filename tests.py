@@ -13,56 +13,19 @@ else:  # pragma: no cover
 # I use the names imap and range3 to make it explicit for Python2 programmers and avoid confusion
 # <<< compatibility with Python 3
 
+import factoradic
 from factoradic import Factoradic, FactoradicException
 import unittest
-import functools
-import time
 import random
+from math import factorial as fact
 
 
-# >>> profiling
-PROF_DATA = {}
+def first_element(rank, permutation):  # module level, so that worker processes can unpickle it
+    return rank, permutation[0]
 
 
-def profile_time(fn):
-    @functools.wraps(fn)
-    def with_profiling(*args, **kwargs):
-        start_time = time.time()
-
-        ret = fn(*args, **kwargs)
-
-        elapsed_time = time.time() - start_time
-
-        if fn.__name__ not in PROF_DATA:
-            PROF_DATA[fn.__name__] = {'count': 0, 'times': [], 'max': -1, 'avg': -1}
-        PROF_DATA[fn.__name__]['count'] += 1
-        PROF_DATA[fn.__name__]['times'].append(elapsed_time)
-
-        return ret
-
-    return with_profiling
-
-
-def calc_prof_data():
-    for fname, data in PROF_DATA.items():
-        max_time = max(data['times'])
-        avg_time = sum(data['times']) / len(data['times'])
-        PROF_DATA[fname]['max'] = max_time
-        PROF_DATA[fname]['avg'] = avg_time
-
-
-def print_prof_data():
-    for fname, data in PROF_DATA.items():
-        max_time = PROF_DATA[fname]['max']
-        avg_time = PROF_DATA[fname]['avg']
-        print('\nFunction %s called %d times. Execution time max: %.3f, average: %.3f.' % (fname, data['count'],
-                                                                                        max_time, avg_time),)
-
-
-def clear_profile_time():
-    global PROF_DATA
-    PROF_DATA = {}
-# <<< profiling
+def count_first_is_zero(count, rank_first):
+    return count + (rank_first[1] == 0)
 
 
 class TestCaseFactoradicLowlevel(unittest.TestCase):
@@ -71,7 +34,6 @@ class TestCaseFactoradicLowlevel(unittest.TestCase):
 
     def tearDown(self):
         print("----- tearDown -----")
-        clear_profile_time()
 
     def test_known_cases_and_conversions(self):
         # Wikipedia example: 463 == factoradic_to_number(string_to_factoradic("341010"))
@@ -85,6 +47,10 @@ class TestCaseFactoradicLowlevel(unittest.TestCase):
         # ... for carry-over.
         assert Factoradic.number_to_factoradic(7) == [1, 0, 1, 0], "test case ERROR (7)"
 
+        if factoradic.numpy is not None:  # NumPy integer scalars, as in the arrays of the batch conversions
+            for scalar in (factoradic.numpy.uint64(463), factoradic.numpy.int64(463), factoradic.numpy.uint8(5)):
+                assert Factoradic.number_to_factoradic(scalar) == Factoradic.number_to_factoradic(int(scalar))
+
     def test_factoradic_iteration(self):
         f_j = Factoradic.number_to_factoradic(0)
         for j in range3(0, 720):
@@ -93,23 +59,81 @@ class TestCaseFactoradicLowlevel(unittest.TestCase):
             f_j = Factoradic.next_factoradic(f_j)
             assert Factoradic.number_to_factoradic(j) != f_j, "ERROR consecutive factoradics shouldn't match"
 
-    def test_factoradic_iteration_timed(self):
+    def test_factoradic_iteration_large(self):  # timings: see benchmarks.py
         start = (2 ** 607) - 1
-        start **= 20  # we need a really large number to even get significant times in a modern computer
-        end   = start + 100  # avg: 0.011 per iteration in my comp. for number_to_factoradic, 0.001 for next_factoradic
+        start **= 20  # a really large number
+        end   = start + 100
         f_j = Factoradic.number_to_factoradic(start)
-        profiled_number_to_factoradic = profile_time(Factoradic.number_to_factoradic)
-        profiled_next_factoradic = profile_time(Factoradic.next_factoradic)
 
         for j in range3(start, end):
             # print(j, number_to_factoradic(j), "f_j", f_j)
-            assert profiled_number_to_factoradic(j) == f_j, "ERROR factoradics don't match"
-            f_j = profiled_next_factoradic(f_j)
-            assert profiled_number_to_factoradic(j) != f_j, "ERROR consecutive factoradics shouldn't match"
+            assert Factoradic.number_to_factoradic(j) == f_j, "ERROR factoradics don't match"
+            f_j = Factoradic.next_factoradic(f_j)
+            assert Factoradic.number_to_factoradic(j) != f_j, "ERROR consecutive factoradics shouldn't match"
 
-        calc_prof_data()
-        print_prof_data()
 
+    def test_number_to_factoradic_dc(self):
+        # the divide and conquer conversion must give exactly the same digits as the iterative one
+        for j in list(range3(0, 800)) + [(2 ** 607) - 1, 2 ** 5000, ((2 ** 607) - 1) ** 20]:
+            assert Factoradic.number_to_factoradic_dc(j) == Factoradic.number_to_factoradic_iterative(j), \
+                "ERROR divide and conquer conversion mismatch for " + str(j)
+
+        for _ in range3(50):
+            x = random.getrandbits(random.randint(1, 20000))
+            assert Factoradic.number_to_factoradic_dc(x) == Factoradic.number_to_factoradic_iterative(x)
+            assert Factoradic.number_to_factoradic(x) == Factoradic.number_to_factoradic_iterative(x)
+
+        big = fact(3000)  # exact factorials are the boundary case for the length of the result
+        assert Factoradic.number_to_factoradic(big) == [1] + [0] * 3000
+        assert Factoradic.number_to_factoradic(big - 1) == list(range3(2999, -1, -1))
+
+    def test_factoradic_to_number_dc(self):
+        for j in range3(0, 800):
+            f_j = Factoradic.number_to_factoradic(j)
+            assert Factoradic.factoradic_to_number_iterative(f_j) == j, "ERROR Horner conversion mismatch"
+            assert Factoradic.factoradic_to_number_dc(f_j) == j, "ERROR product tree conversion mismatch"
+
+        for _ in range3(20):
+            x = random.getrandbits(random.randint(1, 60000))
+            f_x = Factoradic.number_to_factoradic(x)
+            assert Factoradic.factoradic_to_number_dc(f_x) == Factoradic.factoradic_to_number_iterative(f_x) == x
+            assert Factoradic.factoradic_to_number(f_x) == x
+
+        # not well formed digits are still weighted by their factorial, and the last digit is still ignored
+        assert Factoradic.factoradic_to_number_dc([463, 0]) == Factoradic.factoradic_to_number([463, 0]) == 463
+        assert Factoradic.factoradic_to_number_dc([1, 1]) == Factoradic.factoradic_to_number([1, 1]) == 1
+        assert Factoradic.factoradic_to_number_dc([]) == Factoradic.factoradic_to_number([]) == 0
+
+    def test_factorial_cache(self):
+        factoradic.clear_factorial_cache()
+        info = factoradic.factorial_cache_info()
+        assert info['entries'] == 0 and info['bytes'] == 0 and info['hits'] == 0
+
+        x = random.getrandbits(30000)
+        f_x = Factoradic.number_to_factoradic(x)
+        entries = factoradic.factorial_cache_info()['entries']
+        assert entries > 0, "ERROR conversions should fill the cache"
+        assert Factoradic.factoradic_to_number(f_x) == x  # similar size: the product tree is shared
+        assert Factoradic.number_to_factoradic(x + 12345) == Factoradic.number_to_factoradic_iterative(x + 12345)
+        info = factoradic.factorial_cache_info()
+        assert info['entries'] == entries and info['hits'] >= 2
+
+        for n in (0, 1, 10, 500, 510, 2000):
+            assert factoradic.cached_factorial(n) == fact(n)
+        assert factoradic.cached_factorial(510) == fact(510)
+
+        try:
+            factoradic.set_factorial_cache_limit(4096)  # evicts the product trees, which are over the limit
+            info = factoradic.factorial_cache_info()
+            assert info['bytes'] <= 4096 and info['entries'] < entries + 6
+            assert Factoradic.number_to_factoradic(x) == f_x and Factoradic.factoradic_to_number(f_x) == x
+            factoradic.set_factorial_cache_limit(0)
+            assert factoradic.factorial_cache_info()['entries'] == 0
+            assert Factoradic.factoradic_to_number(f_x) == x and factoradic.factorial_cache_info()['entries'] == 0
+        finally:
+            factoradic.set_factorial_cache_limit(factoradic.FACTORIAL_CACHE_MAX_BYTES)
+        factoradic.clear_factorial_cache()
+        assert factoradic.factorial_cache_info()['entries'] == 0
 
     def test_factoradic_iterate_permutations(self):
         for j in range3(20):
@@ -121,6 +145,548 @@ class TestCaseFactoradicLowlevel(unittest.TestCase):
                 # ... because we regenerate "elements" every loop, but generally we don't want to modify parameters
             print(j, factoradic, Factoradic.generate_permutation_from_factoradic(factoradic, elements))
 
+    def test_permutation_fenwick(self):
+        # the Fenwick tree engine must give the same permutations as popping from the list, cycling and padding included
+        for j in range3(0, 150):
+            f_j = Factoradic.number_to_factoradic(j)
+            for size in range3(0, 7):
+                elements = list(range3(size))
+                assert Factoradic.generate_permutation_from_factoradic_fenwick(f_j, elements) == \
+                    Factoradic.generate_permutation_from_factoradic(f_j, elements), "ERROR Fenwick mismatch"
+                assert elements == list(range3(size)), "ERROR elements should not be modified"
+
+        for _ in range3(20):
+            n_f = Factoradic.number_to_factoradic(random.getrandbits(random.randint(1, 3000)))
+            elements = [str(x) for x in range3(len(n_f))]
+            assert Factoradic.generate_permutation_from_factoradic_fenwick(n_f, elements) == \
+                Factoradic.generate_permutation_from_factoradic(n_f, elements)
+
+        with self.assertRaises(IndexError):  # same failure as list.pop on a not well formed factoradic
+            Factoradic.generate_permutation_from_factoradic_fenwick([3, 0, 0], [0, 1, 2])
+
+        # above the threshold generate_permutation_from_factoradic uses the Fenwick tree engine
+        size = factoradic.PERMUTATION_FENWICK_THRESHOLD + 1
+        n_f = [size - 1 - i for i in range3(size)]  # last permutation, the reversed list
+        elements = list(range3(size))
+        assert Factoradic.generate_permutation_from_factoradic(n_f, elements) == elements[::-1]
+        assert Factoradic.generate_permutation_from_factoradic_inplace(n_f, elements) == list(range3(size - 1, -1, -1))
+        assert elements == []
+
+    def test_factoradic_from_permutation(self):
+        for size in range3(0, 6):
+            elements = [chr(ord('a') + x) for x in range3(size)]
+            for j in range3(0, 800):
+                f_j = Factoradic.number_to_factoradic(j)
+                perm = Factoradic.generate_permutation_from_factoradic(f_j, elements)
+                ranked = Factoradic.factoradic_from_permutation(perm, elements)
+                assert len(ranked) == size
+                assert ranked == Factoradic.factoradic_from_permutation_fenwick(perm, elements)
+                assert Factoradic.generate_permutation_from_factoradic(ranked, elements) == perm, "ERROR round trip"
+                assert Factoradic.from_permutation(perm, elements).to_number() == j % fact(size), "ERROR cycling"
+
+        # large permutations round trip with both engines
+        n_f = Factoradic.number_to_factoradic(((2 ** 607) - 1) ** 5)
+        elements = list(range3(len(n_f) + 10))  # shorter factoradics are padded
+        perm = Factoradic.generate_permutation_from_factoradic(n_f, elements)
+        assert Factoradic.factoradic_from_permutation_fenwick(perm, elements)[10:] == n_f
+        assert Factoradic.from_permutation(perm, elements) == Factoradic(n_f)
+
+        # repeated elements give the lowest factoradic producing that permutation
+        assert Factoradic.factoradic_from_permutation([1, 0, 1], [0, 1, 1]) == [1, 0, 0]
+
+        with self.assertRaises(FactoradicException):
+            Factoradic.factoradic_from_permutation([0, 1], [0, 1, 2])
+        with self.assertRaises(FactoradicException):
+            Factoradic.factoradic_from_permutation([0, 1, 3], [0, 1, 2])
+        with self.assertRaises(FactoradicException):
+            Factoradic.factoradic_from_permutation([0, 1, 1], [0, 1, 2])
+
+        # unhashable elements, repeated ones included: exact round trip too
+        elements = [[1], [2], [1], {'a': 3}]
+        for j in range3(fact(4)):
+            digits = Factoradic.padded_to_length_s(Factoradic.number_to_factoradic(j), 4)
+            perm = Factoradic.generate_permutation_from_factoradic(digits, elements)
+            back = Factoradic.factoradic_from_permutation(perm, elements)
+            assert Factoradic.generate_permutation_from_factoradic(back, elements) == perm
+            assert back <= digits  # the lowest of the factoradics giving it: the two [1] can be swapped
+        for j in range3(fact(3)):
+            digits = Factoradic.padded_to_length_s(Factoradic.number_to_factoradic(j), 3)
+            perm = Factoradic.generate_permutation_from_factoradic(digits, [[1], [2], [3]])
+            assert Factoradic.factoradic_from_permutation(perm, [[1], [2], [3]]) == digits
+        with self.assertRaises(FactoradicException):
+            Factoradic.factoradic_from_permutation([[2], [2], [3]], [[1], [2], [3]])
+        with self.assertRaises(FactoradicException):
+            Factoradic.factoradic_from_permutation([[1], 2, 3], [1, 2, 3])  # unhashable, but not in elements
+
+    def test_iter_permutations(self):
+        for size in range3(0, 6):
+            elements = [chr(ord('a') + x) for x in range3(size)]
+            expected = [Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(j), elements)
+                        for j in range3(0, 300)]
+            assert list(Factoradic.iter_permutations(elements)) == expected[:fact(size)], "ERROR full iteration"
+            for start in (0, 1, 5, 23, 100):
+                assert list(Factoradic.iter_permutations(elements, start, 300)) == expected[start:], \
+                    "ERROR iteration from " + str(start)
+                assert list(Factoradic.iter_permutations(elements, Factoradic(start), start + 7)) == \
+                    expected[start:start + 7]
+            assert list(Factoradic.iter_permutations(elements, 5, 5)) == []
+
+        # reusing the buffer yields the same list object every time, updated in place
+        seen = []
+        for j, perm in enumerate(Factoradic.iter_permutations([0, 1, 2, 3], 3, 10, reuse_buffer=True)):
+            seen.append(perm)
+            assert perm == Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(3 + j),
+                                                                           [0, 1, 2, 3])
+        assert len(seen) == 7 and all(perm is seen[0] for perm in seen)
+        with self.assertRaises(FactoradicException):
+            list(Factoradic.iter_permutations([0, 1, 2], -1, 2))
+
+        # from a huge rank, in a large list, it stays consistent with generate_permutation_from_factoradic
+        start = ((2 ** 607) - 1) ** 3
+        elements = list(range3(len(Factoradic.number_to_factoradic(start))))
+        for j, perm in enumerate(Factoradic.iter_permutations(elements, start, start + 50)):
+            assert perm == Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(start + j),
+                                                                           elements)
+
+    def test_k_permutations_and_combinations(self):
+        for size in range3(0, 6):
+            elements = [chr(ord('a') + x) for x in range3(size)]
+            for k in range3(0, size + 1):
+                # the prefixes of the full permutations, in the same order
+                expected = []
+                for perm in Factoradic.iter_permutations(elements):
+                    if perm[:k] not in expected:
+                        expected.append(perm[:k])
+                assert Factoradic.count_k_permutations(size, k) == len(expected)
+                assert [Factoradic.generate_k_permutation(j, elements, k) for j in range3(len(expected))] == expected
+                assert [Factoradic.rank_k_permutation(perm, elements) for perm in expected] == \
+                    list(range3(len(expected)))
+                assert list(Factoradic.iter_k_permutations(elements, k)) == expected
+                assert list(Factoradic.iter_k_permutations(elements, k, 1, 4)) == expected[1:4]
+
+                # combinadic: C(c1, 1) + C(c2, 2) + ... for the positions c1 < c2 < ...
+                combinations = [Factoradic.generate_combination(j, elements, k)
+                                for j in range3(Factoradic.count_combinations(size, k))]
+                assert len(combinations) == fact(size) // fact(k) // fact(size - k)
+                for j, combination in enumerate(combinations):
+                    positions = [elements.index(x) for x in combination]
+                    assert positions == sorted(positions) and sorted(set(combination)) == combination
+                    binomials = [fact(c) // fact(i + 1) // fact(c - i - 1) for i, c in enumerate(positions) if c > i]
+                    assert sum(binomials) == j
+                    assert Factoradic.rank_combination(combination[::-1], elements) == j  # any order
+                assert list(Factoradic.iter_combinations(elements, k)) == combinations
+                assert list(Factoradic.iter_combinations(elements, k, 2, 5)) == combinations[2:5]
+
+        # huge n: the work depends on k only, with a range as the elements
+        n = 10 ** 12
+        rank = random.randrange(Factoradic.count_k_permutations(n, 40))
+        k_permutation = Factoradic.generate_k_permutation(rank, range3(n), 40)
+        assert len(set(k_permutation)) == 40 and Factoradic.rank_k_permutation(k_permutation, range3(n)) == rank
+        for j, perm in enumerate(Factoradic.iter_k_permutations(range3(n), 40, rank, rank + 50)):
+            assert perm == Factoradic.generate_k_permutation(rank + j, range3(n), 40)
+        rank = random.randrange(Factoradic.count_combinations(n, 40))
+        combination = Factoradic.generate_combination(rank, range3(n), 40)
+        assert Factoradic.rank_combination(combination, range3(n)) == rank
+        for j, combination in enumerate(Factoradic.iter_combinations(range3(n), 40, rank, rank + 50)):
+            assert combination == Factoradic.generate_combination(rank + j, range3(n), 40)
+
+        with self.assertRaises(FactoradicException):
+            Factoradic.generate_k_permutation(60, [1, 2, 3, 4, 5], 3)  # 5 * 4 * 3 of them
+        with self.assertRaises(FactoradicException):
+            Factoradic.generate_combination(0, [1, 2, 3], 4)
+        with self.assertRaises(FactoradicException):
+            Factoradic.rank_k_permutation([1, 1], [1, 2, 3])
+        with self.assertRaises(FactoradicException):
+            Factoradic.rank_combination([4], range3(3))
+
+    def test_multiset_permutations(self):
+        for elements in ([], ['a'], ['b', 'a', 'b'], ['a', 'a', 'a'], list('mississippi')[:7], [3, 1, 3, 1, 2, 3]):
+            # the distinct permutations, in the order of iter_permutations (values ordered by first occurrence)
+            first = dict((x, elements.index(x)) for x in elements)
+            indices = sorted(range3(len(elements)), key=lambda i: first[elements[i]])
+            expected = []
+            for perm in Factoradic.iter_permutations([elements[i] for i in indices]):
+                if perm not in expected:
+                    expected.append(perm)
+            assert Factoradic.count_multiset_permutations(elements) == len(expected)
+            assert [Factoradic.generate_multiset_permutation(j, elements) for j in range3(len(expected))] == expected
+            assert [Factoradic.rank_multiset_permutation(perm, elements) for perm in expected] == \
+                list(range3(len(expected)))
+            assert list(Factoradic.iter_multiset_permutations(elements)) == expected
+            assert list(Factoradic.iter_multiset_permutations(elements, 2, 9)) == expected[2:9]
+
+        # without repeated values it's the same as the plain permutations
+        elements = list(range3(8))
+        for j in (0, 1, 1000, fact(8) - 1):
+            perm = Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(j), elements)
+            assert Factoradic.generate_multiset_permutation(j, elements) == perm
+            assert Factoradic.rank_multiset_permutation(perm, elements) == j
+
+        # large: 3000 items of 30 values
+        elements = [x % 30 for x in range3(3000)]
+        total = Factoradic.count_multiset_permutations(elements)
+        assert total == fact(3000) // fact(100) ** 30
+        rank = random.randrange(total)
+        perm = Factoradic.generate_multiset_permutation(rank, elements)
+        assert sorted(perm) == sorted(elements) and Factoradic.rank_multiset_permutation(perm, elements) == rank
+        for j, perm in enumerate(Factoradic.iter_multiset_permutations(elements, rank, rank + 20)):
+            assert Factoradic.rank_multiset_permutation(perm, elements) == rank + j
+
+        with self.assertRaises(FactoradicException):
+            Factoradic.generate_multiset_permutation(3, ['a', 'b', 'a'])
+        with self.assertRaises(FactoradicException):
+            Factoradic.rank_multiset_permutation(['a', 'b', 'b'], ['a', 'b', 'a'])
+
+    def test_permutation_algebra(self):
+        def unrank(rank, n):
+            return Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(rank),
+                                                                   list(range3(n)))
+
+        def rank_of(perm):
+            digits = Factoradic.factoradic_from_permutation(perm, list(range3(len(perm))))
+            return Factoradic.factoradic_to_number(digits)
+
+        factoradic.clear_permutation_cycles_cache()
+        for n in range3(1, 6):
+            for a in range3(fact(n)):
+                p = unrank(a, n)
+                inverse = [p.index(i) for i in range3(n)]
+                assert Factoradic.inverse_permutation_rank(a, n) == rank_of(inverse)
+                inversions = sum(1 for i in range3(n) for j in range3(i + 1, n) if p[i] > p[j])
+                assert Factoradic.permutation_parity(a, n) == inversions % 2
+                assert Factoradic.permutation_sign(Factoradic(a), n) == (-1) ** inversions
+                power = list(range3(n))
+                for k in range3(0, 7):
+                    assert Factoradic.power_permutation_rank(a, n, k) == rank_of(power), "ERROR power " + str(k)
+                    power = [p[i] for i in power]
+                assert Factoradic.power_permutation_rank(a, n, -1) == rank_of(inverse)
+                for b in range3(0, fact(n), 7):
+                    q = unrank(b, n)
+                    assert Factoradic.compose_permutation_ranks(a, b, n) == rank_of([p[i] for i in q])
+        info = factoradic.permutation_cycles_cache_info()
+        assert info['hits'] > info['misses'] and info['entries'] <= factoradic.PERMUTATION_CYCLES_CACHE_SIZE
+
+        # large, with the digit form: no conversion to numbers on the way
+        n = 60000
+        g = Factoradic.trusted([random.randrange(n - i) for i in range3(n)])
+        inverse = Factoradic.inverse_permutation_rank(g, n)
+        assert isinstance(inverse, Factoradic) and inverse._n is None
+        assert Factoradic.compose_permutation_ranks(g, inverse, n) == Factoradic(0)
+        assert Factoradic.compose_permutation_ranks(inverse, g, n) == Factoradic(0)
+        g2, g3 = Factoradic.power_permutation_rank(g, n, 2), Factoradic.power_permutation_rank(g, n, 3)
+        assert Factoradic.compose_permutation_ranks(g, g2, n) == g3
+        assert Factoradic.permutation_parity(g3, n) == (3 * Factoradic.permutation_parity(g, n)) % 2
+
+        with self.assertRaises(FactoradicException):
+            Factoradic.inverse_permutation_rank(6, 3)
+        with self.assertRaises(FactoradicException):
+            Factoradic.permutation_parity(6, 3)  # out of range, as for the other operations
+        with self.assertRaises(FactoradicException):
+            Factoradic.permutation_sign(-1, 3)
+        with self.assertRaises(FactoradicException):
+            Factoradic.compose_permutation_ranks(0, -1, 3)
+        factoradic.clear_permutation_cycles_cache()
+        assert factoradic.permutation_cycles_cache_info()['entries'] == 0
+
+    def test_parallel_permutations(self):
+        elements = list(range3(6))
+        expected = list(Factoradic.iter_permutations(elements, 100, 1000))
+
+        chunks = list(Factoradic.parallel_permutations(elements, 100, 1000, chunk_size=64, max_workers=2))
+        assert [c[0] for c in chunks] == list(range3(100, 1000, 64)), "ERROR chunks should come in rank order"
+        assert chunks[-1][1] == 1000
+        assert [perm for c in chunks for perm in c[2]] == expected, "ERROR chunks differ from serial iteration"
+
+        mapped = Factoradic.parallel_permutations(elements, 100, 1000, map_fn=first_element, chunk_size=100,
+                                                  max_workers=2)
+        assert [x for c in mapped for x in c[2]] == [(100 + j, perm[0]) for j, perm in enumerate(expected)]
+
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(3)
+        reduced = Factoradic.parallel_permutations(elements, 100, 1000, map_fn=first_element,
+                                                   reduce_fn=count_first_is_zero, initial=0, chunk_size=50,
+                                                   ordered=False, executor=executor)
+        assert sum(c[2] for c in reduced) == sum(1 for perm in expected if perm[0] == 0)
+        assert list(Factoradic.parallel_permutations(elements, 5, 5, executor=executor)) == []
+        counted = Factoradic.parallel_permutations(elements, 0, 100, reduce_fn=lambda acc, perm: (acc or 0) + 1,
+                                                   initial=None, chunk_size=30, executor=executor)  # folds from None
+        assert [c[2] for c in counted] == [30, 30, 30, 10]
+        executor.shutdown()
+
+    def test_batch_conversions(self):
+        small = [random.randint(0, fact(20) - 1) for _ in range3(500)] + [0, 1, fact(20) - 1]
+        big = [random.getrandbits(100) for _ in range3(50)]
+        saved_numpy = factoradic.numpy
+        try:
+            for numpy_module in (saved_numpy, None):  # with NumPy (if installed) and the pure Python fallback
+                factoradic.numpy = numpy_module
+                for values in (small, big):
+                    matrix = Factoradic.numbers_to_factoradics(iter(values))
+                    width = len(Factoradic.number_to_factoradic(max(values)))
+                    assert len(matrix) == len(values) and all(len(row) == width for row in matrix)
+                    for value, row in zip(values, matrix):
+                        assert [int(digit) for digit in row] == \
+                            Factoradic.padded_to_length_s(Factoradic.number_to_factoradic(value), width)
+                    assert [int(x) for x in Factoradic.factoradics_to_numbers(matrix)] == values, "ERROR batch"
+
+                matrix = Factoradic.numbers_to_factoradics([5, 6], width=6)
+                assert [[int(digit) for digit in row] for row in matrix] == [[0, 0, 0, 2, 1, 0], [0, 0, 1, 0, 0, 0]]
+                assert [int(x) for x in Factoradic.factoradics_to_numbers(matrix)] == [5, 6]
+                with self.assertRaises(FactoradicException):
+                    Factoradic.numbers_to_factoradics([6], width=3)  # [1, 0, 0, 0] doesn't fit
+                assert [int(x) for x in Factoradic.factoradics_to_numbers([[1, 0], [2, 1, 0]])] == [1, 5]  # ragged
+                for bad in ([-1], [7.9], [3, '4']):  # only integers >= 0
+                    with self.assertRaises(FactoradicException):
+                        Factoradic.numbers_to_factoradics(bad)
+        finally:
+            factoradic.numpy = saved_numpy
+
+        if saved_numpy is not None:
+            matrix = Factoradic.numbers_to_factoradics(saved_numpy.array(small, dtype=saved_numpy.uint64))
+            assert isinstance(matrix, saved_numpy.ndarray) and matrix.shape == (len(small), 20)
+            numbers = Factoradic.factoradics_to_numbers(matrix)
+            assert numbers.dtype == saved_numpy.uint64 and [int(x) for x in numbers] == small
+            signed = Factoradic.numbers_to_factoradics(saved_numpy.array([5, 6], dtype=saved_numpy.int64))
+            assert [[int(digit) for digit in row] for row in signed] == [[0, 2, 1, 0], [1, 0, 0, 0]]
+            for bad in (saved_numpy.array([-1], dtype=saved_numpy.int64), saved_numpy.array([7.9])):
+                with self.assertRaises(FactoradicException):
+                    Factoradic.numbers_to_factoradics(bad)  # not cast to 2 ** 64 - 1, or to 7
+
+    def test_batch_permutations(self):
+        import array
+        ranks = [random.randint(0, fact(9) - 1) for _ in range3(300)] + [0, fact(9) - 1]
+        saved_numpy = factoradic.numpy
+        try:
+            for numpy_module in (saved_numpy, None):
+                factoradic.numpy = numpy_module
+                matrix = Factoradic.numbers_to_factoradics(ranks)
+                for size in (4, 9, 12):  # cycling, same width and padding
+                    elements = list(range3(10, 10 + size))
+                    expected = [Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(r),
+                                                                                elements) for r in ranks]
+                    perms = Factoradic.generate_permutations_from_factoradics(matrix, elements)
+                    assert [[int(x) for x in row] for row in perms] == expected, "ERROR batch permutations"
+
+                    out = array.array('i', [0] * (len(ranks) * size))
+                    assert Factoradic.generate_permutations_from_factoradics(matrix, elements, out) is out
+                    assert list(out) == [x for row in expected for x in row], "ERROR batch permutations (buffer)"
+                perms = Factoradic.generate_permutations_from_factoradics([[0], [0]], [])  # no elements
+                assert [list(perm) for perm in perms] == [[], []]
+        finally:
+            factoradic.numpy = saved_numpy
+
+        if saved_numpy is not None:
+            out = saved_numpy.zeros((len(ranks), 9), dtype=saved_numpy.int16)
+            matrix = Factoradic.numbers_to_factoradics(ranks)
+            assert Factoradic.generate_permutations_from_factoradics(matrix, list(range3(9)), out) is out
+            assert [int(x) for x in out[-1]] == list(range3(8, -1, -1))
+            with self.assertRaises(FactoradicException):
+                Factoradic.generate_permutations_from_factoradics([[3, 0, 0]], [0, 1, 2])
+
+    def test_permutation_sampler(self):
+        elements = list('abcdefg')
+        sampler = factoradic.PermutationSampler(7, seed=2024)
+        samples = [sampler.sample(elements) for _ in range3(50)]
+        for rank, perm in samples:  # the rank and the permutation of a sample agree
+            assert perm == Factoradic.generate_permutation_from_factoradic(Factoradic.number_to_factoradic(rank),
+                                                                           elements)
+        again = factoradic.PermutationSampler(7, seed=2024)
+        assert [again.sample(elements) for _ in range3(50)] == samples, "ERROR same seed, same samples"
+        assert len(set(rank for rank, _ in samples)) > 40
+
+        # child streams: reproducible, independent of the parent's use and of each other
+        children = [sampler.spawn(i) for i in range3(3)]
+        assert [child.rank() for child in children] == [factoradic.PermutationSampler(7, 2024, (i,)).rank()
+                                                        for i in range3(3)]
+        assert [child.factoradic() for child in children] != [child.factoradic() for child in children]
+        assert sampler.spawn(0).spawn(5).stream == (0, 5)
+        key_clashes = ((factoradic.PermutationSampler(7, '1,2'), factoradic.PermutationSampler(7, 1, (2,))),
+                       (factoradic.PermutationSampler(7, 1, (2,)), factoradic.PermutationSampler(7, 1, ('2',))))
+        for one, other in key_clashes:  # streams only meet when seed and stream path are the same
+            assert [one.rank() for _ in range3(5)] != [other.rank() for _ in range3(5)]
+        assert factoradic.PermutationSampler(7).seed != factoradic.PermutationSampler(7).seed  # random seeds
+
+        # each permutation of 3 items about as often as the others (expected 2000 each)
+        counts = {}
+        small = factoradic.PermutationSampler(3, seed=11)
+        for _ in range3(12000):
+            rank = small.rank()
+            counts[rank] = counts.get(rank, 0) + 1
+        assert sorted(counts) == list(range3(6)) and all(1700 < count < 2300 for count in counts.values())
+
+        big = factoradic.PermutationSampler(1000, seed=1)
+        digits = big.factoradic()
+        assert len(digits) == 1000 and Factoradic.is_well_formed_factoradic(digits)
+        assert sorted(big.permutation()) == list(range3(1000))
+
+        saved_numpy = factoradic.numpy
+        try:
+            for numpy_module in (saved_numpy, None):
+                factoradic.numpy = numpy_module
+                ranks, perms = factoradic.PermutationSampler(9, seed=5).batch(500, list(range3(10, 19)))
+                assert len(ranks) == len(perms) == 500
+                for rank, perm in zip(ranks, perms):
+                    assert [int(x) for x in perm] == Factoradic.generate_permutation_from_factoradic(
+                        Factoradic.number_to_factoradic(int(rank)), list(range3(10, 19)))
+                again = factoradic.PermutationSampler(9, seed=5).batch(500, list(range3(10, 19)))[0]
+                assert [int(rank) for rank in again] == [int(rank) for rank in ranks]
+                assert len(set(int(rank) for rank in ranks)) > 450
+                ranks, perms = factoradic.PermutationSampler(0, seed=1).batch(3)  # no elements: empty permutations
+                assert [int(rank) for rank in ranks] == [0, 0, 0] and [list(perm) for perm in perms] == [[], [], []]
+        finally:
+            factoradic.numpy = saved_numpy
+
+        with self.assertRaises(FactoradicException):
+            factoradic.PermutationSampler(3).permutation([1, 2])
+
+    def test_factoradic_store(self):
+        import os
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'store')
+            assert factoradic.FactoradicStore.build(path, 6, 100, 700) == 600
+            with factoradic.FactoradicStore(path) as store:
+                assert store.kind == 'factoradic' and len(store) == 600 and store.first_rank == 100
+                for rank in range3(100, 700):
+                    expected = Factoradic.padded_to_length_s(Factoradic.number_to_factoradic(rank), 6)
+                    assert store.by_rank(rank) == expected
+                assert store[2:5] == [store[2], store[3], store[4]] and store[-1] == store.by_rank(699)
+                assert store[598:1000] == [store[598], store[599]] and store[::300] == [store[0], store[300]]
+                view = store.view(363)
+                assert list(view) == Factoradic(463).v
+                view.release()
+                view = store.view(-1)  # negative indices, as with store[-1]
+                assert list(view) == store[-1]
+                view.release()
+                with self.assertRaises(IndexError):
+                    store.by_rank(700)
+                with self.assertRaises(IndexError):
+                    store.view(-601)
+
+            start = ((2 ** 607) - 1) ** 2
+            elements = list(range3(250))
+            assert factoradic.FactoradicStore.build(path, 250, start, start + 50, kind='permutation') == 50
+            with factoradic.FactoradicStore(path) as store:
+                assert store.kind == 'permutation' and store.first_rank == start
+                for rank, perm in zip(range3(start, start + 50), Factoradic.iter_permutations(elements, start)):
+                    assert store.by_rank(rank) == perm
+                assert store.permutation(start, [str(x) for x in elements]) == [str(x) for x in store[0]]
+
+            records = [[1, 0], Factoradic(463), [0, 2, 1, 0]]
+            assert factoradic.FactoradicStore.write(path, records, 6) == 3
+            with factoradic.FactoradicStore(path) as store:
+                assert store[:] == [[0, 0, 0, 0, 1, 0], [3, 4, 1, 0, 1, 0], [0, 0, 0, 2, 1, 0]]
+            with self.assertRaises(FactoradicException):
+                factoradic.FactoradicStore.write(path, [[1, 0, 0]], 2)
+            for bad_records, kind in (([[9, 9, 9]], 'permutation'), ([[0, 1]], 'permutation'),
+                                      ([[0, 1, 1]], 'permutation'), ([[3, 0, 0]], 'factoradic'),
+                                      ([[1, -1, 0]], 'factoradic')):
+                with self.assertRaises(FactoradicException):
+                    factoradic.FactoradicStore.write(path, bad_records, 3, kind)
+
+            factoradic.FactoradicStore.write(path, [[1, 0]], 2, first_rank=5)
+            with open(path, 'r+b') as f:  # damages the first rank record
+                f.seek(factoradic.FactoradicStore._header.size)
+                f.write(b'\xff')
+            with self.assertRaises(FactoradicException):
+                factoradic.FactoradicStore(path)
+
+            factoradic.FactoradicStore.build(path, 6, 0, 700)
+            with open(path, 'r+b') as f:  # drops the last records, the header still counts them
+                f.truncate(os.path.getsize(path) - 100)
+            with self.assertRaises(FactoradicException):
+                factoradic.FactoradicStore(path)
+
+            with open(path, 'wb') as f:
+                f.write(b'not a store')
+            with self.assertRaises(FactoradicException):
+                factoradic.FactoradicStore(path)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_command_line(self):
+        import io
+
+        def run(argv, data):
+            stdout = io.BytesIO()
+            assert factoradic.main(argv, io.BytesIO(data), stdout) == 0
+            return stdout.getvalue()
+
+        assert run(['to-factoradic'], b'0\n1\n463\n\n5\n') == b'0\n1 0\n3 4 1 0 1 0\n2 1 0\n'
+        assert run(['to-factoradic', '--width', '5', '--chunk-size', '1'], b'5\n6\n') == b'0 0 2 1 0\n0 1 0 0 0\n'
+        assert run(['to-number'], b'3 4 1 0 1 0\n2,1,0\n0\n') == b'463\n5\n0\n'
+        assert run(['unrank', '--elements', 'a,b,c'], b'0\n1\n5\n6\n') == b'a b c\na c b\nc b a\na b c\n'
+        assert run(['rank', '--elements', 'a,b,c'], b'c b a\na,c,b\n') == b'5\n1\n'
+        assert run(['rank', '--size', '3', '--sep', ';'], b'2;0;1\n') == b'4\n'
+
+        records = run(['to-factoradic', '--binary'], b'0\n463\n')
+        assert records == Factoradic(0).to_bytes() + Factoradic(463).to_bytes()
+        assert run(['to-number', '--binary'], records) == b'0\n463\n'
+        assert run(['unrank', '--binary', '--size', '6'], records) == b'0 1 2 3 4 5\n3 5 1 0 4 2\n'
+        assert run(['rank', '--binary', '--size', '6'], b'3 5 1 0 4 2\n') == Factoradic(463).to_bytes()
+
+        numbers = b''.join(str(random.getrandbits(80)).encode('ascii') + b'\n' for _ in range3(300))
+        assert run(['to-number'], run(['to-factoradic', '--workers', '2', '--chunk-size', '64'], numbers)) == numbers
+
+        # many elements: unranked one by one, same output as the batch form
+        ranks = [random.getrandbits(300) for _ in range3(20)]
+        lines = run(['unrank', '--size', '100'], b''.join(str(r).encode('ascii') + b'\n' for r in ranks))
+        assert lines == b''.join(' '.join(str(x) for x in Factoradic.generate_permutation_from_factoradic(
+            Factoradic.number_to_factoradic(r), list(range3(100)))).encode('ascii') + b'\n' for r in ranks)
+        records = b''.join(Factoradic(r).to_bytes() for r in ranks)
+        assert run(['unrank', '--binary', '--size', '100'], records) == lines
+
+        # bad input: the output of the chunks before it, the bad item on stderr and status 1
+        for argv, data, bad in ((['to-factoradic', '--chunk-size', '2'], b'1\n2\n3\nx\n4\n', "'x'"),
+                                (['unrank', '--size', '3', '--chunk-size', '2'], b'1\n2\n3\n-5\n', "'-5'"),
+                                (['rank', '--elements', 'a,b', '--chunk-size', '2', '--workers', '2'],
+                                 b'a b\nb a\na c\n', "'a c'")):
+            stdout, stderr = io.BytesIO(), io.StringIO()
+            assert factoradic.main(argv, io.BytesIO(data), stdout, stderr) == 1
+            assert stdout.getvalue().count(b'\n') == 2 and bad in stderr.getvalue()
+
+    def test_instrumentation(self):
+        original = Factoradic.__dict__['factoradic_to_number']
+        calls = []
+        factoradic.reset_instrumentation()
+        factoradic.enable_instrumentation(lambda *call: calls.append(call))
+        try:
+            assert factoradic.instrumentation_enabled()
+            assert Factoradic.number_to_factoradic(463) == [3, 4, 1, 0, 1, 0]
+            assert Factoradic.factoradic_to_number([3, 4, 1, 0, 1, 0]) == 463
+            assert Factoradic.factoradic_to_number(list(range3(99, -1, -1))) == fact(100) - 1
+            assert Factoradic(463).permutation([0, 1, 2, 3, 4, 5]) == [3, 5, 1, 0, 4, 2]
+            self.assertRaises(FactoradicException, Factoradic.subtract_factoradics, [1, 0], [2, 1, 0])
+            list(Factoradic.iter_permutations([0, 1, 2]))  # generators aren't wrapped
+            assert Factoradic.permutation_parity(Factoradic([3, 4, 1, 0, 1, 0]), 6) == 1  # a Factoradic: its length
+            if sys.version_info >= (3, 4):  # wrappers still pickle by reference, e.g. for process pools
+                import pickle
+                wrapper = Factoradic.number_to_factoradic
+                assert wrapper.__qualname__ == 'Factoradic.number_to_factoradic' and hasattr(wrapper, '__wrapped__')
+                assert pickle.loads(pickle.dumps(wrapper)) is wrapper
+        finally:
+            factoradic.disable_instrumentation()
+        Factoradic.factoradic_to_number([1, 0])  # not counted any more
+        assert Factoradic.__dict__['factoradic_to_number'] is original and not factoradic.instrumentation_enabled()
+
+        stats = factoradic.instrumentation_snapshot()
+        assert sorted(stats['factoradic_to_number']) == [8, 128]
+        assert stats['factoradic_to_number'][8]['calls'] == 1 and stats['factoradic_to_number'][128]['calls'] == 1
+        assert stats['number_to_factoradic'][8]['calls'] == 2  # and Factoradic(463), 463 < 6! estimated from 9 bits
+        assert stats['generate_permutation_from_factoradic'][8]['calls'] == 1
+        assert stats['permutation_parity'][8]['calls'] == 1
+        assert stats['subtract_factoradics'][2] == dict(stats['subtract_factoradics'][2], calls=1, errors=1)
+        assert 'iter_permutations' not in stats
+        latency = stats['factoradic_to_number'][128]
+        assert sum(latency['latency_us'].values()) == 1 and 0 <= latency['max_seconds'] <= latency['total_seconds']
+        assert len(calls) == sum(s['calls'] for by_size in stats.values() for s in by_size.values())
+        assert [call[:2] for call in calls[:2]] == [('number_to_factoradic_iterative', 8), ('number_to_factoradic', 8)]
+        assert calls[0][3] is False  # inner calls are reported first, they end first
+        factoradic.reset_instrumentation()
+        assert factoradic.instrumentation_snapshot() == {}
+
     def test_cascading(self):
         fx = [463, 0]
         cascaded_fx = Factoradic.cascade_factoradic_digits(fx)
@@ -209,7 +775,6 @@ class TestCaseFactoradicObject(unittest.TestCase):
 
     def tearDown(self):
         print("----- tearDown -----")
-        clear_profile_time()
 
     def test_factoradic_init_inc1_next(self):
         f  = Factoradic()
@@ -292,6 +857,79 @@ class TestCaseFactoradicObject(unittest.TestCase):
         with self.assertRaises(FactoradicException):
             f.increment([1,1,0])  # would be factoradic for 3, but we don't accept this at the moment (convert to int)
 
+    def test_decrement_and_early_exit_carry(self):
+        f = Factoradic(0)
+        for j in range3(1, 800):  # counting up and down again
+            f.inc1()
+            assert f == Factoradic(j)
+        for j in range3(798, -1, -1):
+            f.dec1()
+            assert f == Factoradic(j)
+        with self.assertRaises(FactoradicException):
+            f.dec1()  # negative results are not supported
+        assert f == Factoradic(0)
+
+        for _ in range3(200):
+            x = random.getrandbits(random.randint(1, 300))
+            y = random.getrandbits(random.randint(1, 300))
+            f_x = Factoradic(x)
+            f_x.increment(y)
+            assert f_x == Factoradic(x + y)
+            f_x.decrement(y)
+            assert f_x == Factoradic(x)
+            if y > x:
+                with self.assertRaises(FactoradicException):
+                    f_x.decrement(y)
+                assert f_x == Factoradic(x), "ERROR a failed decrement should leave the value unchanged"
+
+            digits = Factoradic.number_to_factoradic(x)
+            assert Factoradic.increment_well_formed_inplace(digits, y) == Factoradic.number_to_factoradic(x + y)
+            assert Factoradic.decrement_well_formed_inplace(digits, y) == Factoradic.number_to_factoradic(x)
+            assert Factoradic.inc1_well_formed_inplace(digits) == Factoradic.next_factoradic(
+                Factoradic.number_to_factoradic(x))
+            assert Factoradic.dec1_well_formed_inplace(digits) == Factoradic.number_to_factoradic(x)
+
+        # crossing the lengths where the digit array gets wider keeps equality and hashing consistent
+        f = Factoradic(fact(256) - 1)
+        f.inc1()
+        assert f == Factoradic(fact(256)) and hash(f) == hash(Factoradic(fact(256)))
+        f.dec1()
+        assert f == Factoradic(fact(256) - 1) and hash(f) == hash(Factoradic(fact(256) - 1))
+        with self.assertRaises(FactoradicException):
+            f.decrement(-1)
+        with self.assertRaises(FactoradicException):
+            f.decrement("one")
+
+    def test_binary_records(self):
+        import io
+        values = [Factoradic(0), Factoradic(1), Factoradic(463), Factoradic(fact(256)), Factoradic(2 ** 70000)]
+        for f in values:
+            data = f.to_bytes()
+            assert Factoradic.from_bytes(data) == f and Factoradic.from_bytes(bytearray(data), validate=False) == f
+            digits, end = Factoradic.digits_view(data)
+            assert end == len(data) and list(digits) == f.v
+        assert Factoradic(463).to_bytes() == b'\x01\x01\x06\x03\x04\x01\x00\x01\x00'  # version, width, length
+
+        stream = io.BytesIO()
+        assert Factoradic.write_factoradics(stream, values + [[0, 0, 1, 0], 5]) == 7
+        data = stream.getvalue()
+        offset = 0
+        for f in values:  # zero-copy, record after record
+            digits, offset = Factoradic.digits_view(data, offset)
+            assert list(digits) == f.v
+        stream.seek(0)
+        read = list(Factoradic.read_factoradics(stream, chunk_size=7))  # records span many chunks
+        assert read == values + [Factoradic(1), Factoradic(5)]
+
+        with self.assertRaises(FactoradicException):
+            Factoradic.from_bytes(Factoradic(463).to_bytes()[:-1])  # truncated
+        with self.assertRaises(FactoradicException):
+            list(Factoradic.read_factoradics(io.BytesIO(data[:-1])))
+        with self.assertRaises(FactoradicException):
+            Factoradic.from_bytes(b'\x01\x01\x02\x02\x00')  # [2, 0] is not well formed
+        with self.assertRaises(FactoradicException):
+            Factoradic.from_bytes(b'\x02\x01\x01\x00')  # unknown version
+
     def test_badly_formed_factoradic(self):
         with self.assertRaises(FactoradicException):
             Factoradic([1])  # badly formed factoradic
@@ -341,24 +979,179 @@ class TestCaseFactoradicObject(unittest.TestCase):
         # test the not-in-place permutation method
         assert perm_f1 == f_1.permutation(list(range3(f_1.length())))
 
-    def test_comparison_against_unsupported_type(self):
+    def test_compact_storage(self):
+        f = Factoradic(463)
+        with self.assertRaises(AttributeError):
+            f.other = 1  # __slots__, no per-instance __dict__
+        assert f.v == [3, 4, 1, 0, 1, 0] and f == [3, 4, 1, 0, 1, 0] and f == Factoradic([3, 4, 1, 0, 1, 0])
+        assert f.length() == 6 and str(f) == str([3, 4, 1, 0, 1, 0])
+
+        f.v = [1, 0, 0, 0]  # the list form can still be assigned
+        assert f == Factoradic(6) and f.to_number() == 6
+        f.v = [0, 1, 0]  # leading zeros are stripped
+        assert f.v == [1, 0] and f == Factoradic(1) and not f > Factoradic(1) and hash(f) == hash(Factoradic(1))
+        for bad in ([], [2, 0], [1, -1, 0]):
+            with self.assertRaises(FactoradicException):
+                f.v = bad
+        assert f.v == [1, 0]  # unchanged
+
+        for value, itemsize in ((fact(10) - 1, 1), (fact(256) - 1, 1), (fact(256), 2), (fact(300), 2)):
+            f = Factoradic(value)
+            assert f._d.itemsize == itemsize, "ERROR digit width should follow the length"
+            assert f.v == Factoradic.number_to_factoradic(value) and f.to_number() == value
+
+        with self.assertRaises(FactoradicException):
+            Factoradic("5")  # a string that isn't a well formed factoradic
+
+    def test_lazy_representation(self):
+        big = ((2 ** 607) - 1) ** 20
+        f = Factoradic(big)
+        assert f._digits is None, "ERROR a number shouldn't be converted until its digits are needed"
+        assert f == Factoradic(big) and hash(f) == hash(Factoradic(big)) and f < Factoradic(big + 1)
+        assert (f + Factoradic(1)).to_number() == big + 1 and (f - Factoradic(big - 5)).to_number() == 5
+        assert (f * 3).to_number() == big * 3
+        f.increment(10)
+        f.decrement(3)
+        assert f.to_number() == big + 7 and f._digits is None
+
+        g = Factoradic(Factoradic.number_to_factoradic(big + 7))  # digits only, until a number is needed
+        assert g._n is None and g == f and hash(g) == hash(f) and g._n == big + 7
+        assert len(set([f, g, Factoradic(f), Factoradic.trusted(big + 7)])) == 1
+        g.inc1()  # both representations kept in step
+        assert g._n == big + 8 and g.v == Factoradic.number_to_factoradic(big + 8)
+        assert f.v == Factoradic.number_to_factoradic(big + 7) and f._digits is not None and f < g
+
+        assert Factoradic.trusted([0, 0, 0, 2, 1, 0]).v == [2, 1, 0]  # leading zeros removed, in linear time
+        assert Factoradic([0] * 50000 + [1, 0]).to_number() == 1
+        h = Factoradic(6)
+        h.decrement(1)
+        assert h == [2, 1, 0] and Factoradic(0) == Factoradic() == [0] and Factoradic.trusted(0).v == [0]
         with self.assertRaises(FactoradicException):
-            f = Factoradic(0)
-            f == 0
+            Factoradic(-1)
         with self.assertRaises(FactoradicException):
-            f = Factoradic("0")
-            f == "0"
+            Factoradic(5) - Factoradic(6)
         with self.assertRaises(FactoradicException):
-            f = Factoradic([1, 0, 0])
-            f == "[1, 0, 0]"
+            h.decrement(6)
+        assert h.to_number() == 5
         with self.assertRaises(FactoradicException):
-            f = Factoradic([1, 0, 0])
-            f == (1, 0, 0)
+            Factoradic([])
+
+    def test_comparison_against_unsupported_type(self):
+        # never equal, but no exception either: Factoradics can share dicts and sets with keys of other types
+        f = Factoradic(0)
+        assert not f == 0 and f != 0
+        f = Factoradic("0")
+        assert not f == "0" and f != "0"
+        f = Factoradic([1, 0, 0])
+        assert not f == "[1, 0, 0]" and f != "[1, 0, 0]"
+        assert not f == (1, 0, 0) and f != (1, 0, 0)
+        assert len({f: 1, 2: 2, "[1, 0, 0]": 3}) == 3
+        if sys.version_info >= (3,):  # Python2 orders unrelated types arbitrarily
+            with self.assertRaises(TypeError):
+                f < (1, 0, 0)
+        with self.assertRaises(TypeError):
+            f + "1"
+
+    def test_arithmetic_and_ordering(self):
+        for _ in range3(200):
+            x = random.getrandbits(random.randint(0, 400))
+            y = random.getrandbits(random.randint(0, 400))
+            f_x, f_y = Factoradic(x), Factoradic(y)
+
+            assert f_x + f_y == Factoradic(x + y) and f_x + y == Factoradic(x + y) and y + f_x == Factoradic(x + y)
+            assert f_x + f_y.v == Factoradic(x + y), "ERROR adding a list"
+            assert f_x * y == Factoradic(x * y) and f_x * f_y == Factoradic(x * y)
+            if x >= y:
+                assert f_x - f_y == Factoradic(x - y) and f_x - y == Factoradic(x - y) and x - f_y == Factoradic(x - y)
+            else:
+                with self.assertRaises(FactoradicException):
+                    f_x - f_y  # negative results are not supported
+            assert (f_x < f_y) == (x < y) and (f_x <= f_y) == (x <= y)
+            assert (f_x > f_y) == (x > y) and (f_x >= f_y) == (x >= y)
+            assert (f_x == f_y) == (x == y) and (f_x != f_y) == (x != y)
+
+        assert Factoradic(5) + (-3) == Factoradic(2) and Factoradic(5) - (-3) == Factoradic(8)
+        assert Factoradic(1) == [0, 1, 0] and Factoradic(1) <= [0, 1, 0] and Factoradic(1) >= [0, 1, 0]  # normalised
+        assert Factoradic(1) != [2, 0] and Factoradic(1) != []  # not factoradics
+        assert Factoradic(5) - 5 == Factoradic(0) and Factoradic(5) * 0 == Factoradic(0)
+        assert Factoradic(5) < [1, 0, 0, 0] and Factoradic(6) >= [0, 1, 0, 0, 0]  # lists compare as factoradics
+        with self.assertRaises(FactoradicException):
+            Factoradic(5) * -1
+
+        digits = Factoradic.number_to_factoradic(random.getrandbits(20000))
+        x = Factoradic.factoradic_to_number(digits)
+        big = random.getrandbits(factoradic.ARITHMETIC_DC_THRESHOLD_BITS + 1000)
+        for make in (lambda: Factoradic.trusted(digits), lambda: Factoradic(x)):  # digits only, number only
+            assert (make() + big).to_number() == x + big and (make() - (-big)).to_number() == x + big
+            assert (make() * big).to_number() == x * big and (make() * Factoradic(big)).to_number() == x * big
+            assert (make() + 5).v == Factoradic(x + 5).v and (make() * 5).v == Factoradic(x * 5).v
+
+        values = [random.randint(0, 10000) for _ in range3(100)]
+        assert [f.to_number() for f in sorted(Factoradic(x) for x in values)] == sorted(values)
+        counts = {}
+        for x in values:
+            counts[Factoradic(x)] = counts.get(Factoradic(x), 0) + 1
+        assert len(counts) == len(set(values)) and hash(Factoradic(7)) == hash(Factoradic([1, 0, 1, 0]))
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio API needs Python 3.5+')
+class TestCaseFactoradicAsync(unittest.TestCase):
+    # no async/await syntax here, so that Python2 can still parse this file
+    def setUp(self):
+        print("----- setUp    -----")
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        print("----- tearDown -----")
+        import asyncio
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_inline_and_offloaded(self):
+        import asyncio
+        import factoradic_async
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(2)
+        converter = factoradic_async.AsyncConverter(executor, max_concurrency=2, inline_max_cost=1000)
+
+        small, big = 463, ((2 ** 607) - 1) ** 5
+        n_f = self.loop.run_until_complete(converter.number_to_factoradic(small))
+        assert n_f == [3, 4, 1, 0, 1, 0] and converter.inline_calls == 1 and converter.offloaded_calls == 0
+
+        coros = [converter.number_to_factoradic(big + j) for j in range3(5)]
+        results = self.loop.run_until_complete(asyncio.gather(*coros))
+        assert results == [Factoradic.number_to_factoradic(big + j) for j in range3(5)]
+        assert converter.offloaded_calls == 5
+
+        assert self.loop.run_until_complete(converter.factoradic_to_number(results[0])) == big
+        elements = list(range3(len(results[0])))
+        perm = self.loop.run_until_complete(converter.generate_permutation_from_factoradic(results[0], elements))
+        assert perm == Factoradic.generate_permutation_from_factoradic(results[0], elements)
+        assert self.loop.run_until_complete(converter.factoradic_from_permutation(perm, elements)) == results[0]
+        assert self.loop.run_until_complete(factoradic_async.number_to_factoradic(small)) == n_f  # default converter
+        executor.shutdown()
+
+    def test_cancellation_and_concurrency_limit(self):
+        import asyncio
+        import factoradic_async
+        converter = factoradic_async.AsyncConverter(max_concurrency=1, inline_max_cost=0)
+        big = 2 ** 400000
+        first = self.loop.create_task(converter.number_to_factoradic(big))
+        second = self.loop.create_task(converter.number_to_factoradic(big + 1))
+        self.loop.run_until_complete(asyncio.sleep(0))  # the first one holds the only slot, the second one waits
+        second.cancel()
+        assert self.loop.run_until_complete(first) == Factoradic.number_to_factoradic(big)
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(second)
+        assert converter.offloaded_calls == 1
+
 
 def suite():
     my_suite = unittest.TestSuite()
     my_suite.addTest(unittest.makeSuite(TestCaseFactoradicLowlevel, 'tests for Factoradic as a bare list'))
     my_suite.addTest(unittest.makeSuite(TestCaseFactoradicObject, 'tests for Factoradic as class object'))
+    my_suite.addTest(unittest.makeSuite(TestCaseFactoradicAsync, 'tests for the asyncio API'))
 
     return my_suite
 